@@ -1,5 +1,9 @@
 import sys
+import multiprocessing
+import numpy as np
 import backend
+from instruments import DEFAULT_COLOR
+from pricestore import time_text
 
 from PySide6.QtWidgets import (
     QApplication,
@@ -16,7 +20,8 @@ from PySide6.QtWidgets import (
     QButtonGroup,
     QStackedWidget,
     QMessageBox,
-    QToolTip
+    QToolTip,
+    QScrollArea,
 )
 from PySide6.QtGui import QColor, QPainter, QPen, QPixmap, QIcon ,QCursor
 from PySide6.QtCore import (
@@ -27,7 +32,7 @@ from PySide6.QtCore import (
     QDateTime,
     QTimer, 
 )
-from PySide6.QtCharts import QChart, QChartView, QLineSeries, QDateTimeAxis ,QCategoryAxis , QScatterSeries
+from PySide6.QtCharts import QChart, QChartView, QLineSeries, QDateTimeAxis ,QCategoryAxis
 
 #! ---------- Data ----------
 key = "7acbe2c3a12c9fbf8a76cd1185dc874f8def2b8f0a81bf146ae39405a357ef79"
@@ -35,29 +40,25 @@ iv = bytes.fromhex("b96808845430d3e213c059a6c9979f39")
 
 
 
-DATA = {
-    "Time": [],
-    "Gold": [],
-    "Coin": [],
-    "USD": [],
-    "USDT": [],
-}
+INSTRUMENTS = backend.INSTRUMENTS
 
-COLORS = {
-    "Gold": "#F97316",
-    "Coin": "#3B82F6",
-    "USD": "#6366F1",
-    "USDT": "#22C55E",
-}
+DATA = backend.new_data(INSTRUMENTS)
+
+COLORS = {item["name"]: item.get("color", DEFAULT_COLOR) for item in INSTRUMENTS}
 
 
 buttons = [
-    ("Gold", COLORS["Gold"], backend.find_resource_path("pics/gold.png")),
-    ("Coin", COLORS["Coin"], backend.find_resource_path("pics/coin.png")),
-    ("USD", COLORS["USD"], backend.find_resource_path("pics/dollar.png")),
-    ("USDT", COLORS["USDT"], backend.find_resource_path("pics/tether.png")),
+    (
+        item["name"],
+        COLORS[item["name"]],
+        backend.find_resource_path(item["icon"]) if item.get("icon") else None,
+    )
+    for item in INSTRUMENTS
 ]
 
+# More buttons than this scroll inside the instrument card
+MAX_VISIBLE_BUTTONS = 8
+
 
 
 #! ---------- Card ----------
@@ -83,6 +84,28 @@ class Card(QFrame):
 
 #! ---------- Animated Chart ----------
 
+def local_msecs(times):
+    # X values as QDateTime.fromString gave them: the stored wall clock read
+    # as local time. One UTC offset for all points unless the sampled ones
+    # disagree (DST inside the span)
+    secs = times.astype(np.int64)
+    if not len(secs):
+        return secs.astype(np.float64)
+
+    samples = np.unique(np.linspace(0, len(secs) - 1, min(len(secs), 64)).astype(int))
+    offsets = {
+        QDateTime.fromString(time_text(times[n]), "yyyy-MM-dd HH:mm:ss").offsetFromUtc()
+        for n in samples
+    }
+    if len(offsets) == 1:
+        return (secs - offsets.pop()) * 1000.0
+
+    return np.array(
+        [QDateTime.fromString(time_text(t), "yyyy-MM-dd HH:mm:ss").toMSecsSinceEpoch() for t in times],
+        np.float64,
+    )
+
+
 class AnimatedChart(QChartView):
     chartChanged = Signal(str)
     
@@ -113,7 +136,7 @@ class AnimatedChart(QChartView):
         self.chart.legend().hide()
         self.setChart(self.chart)
 
-        self._set_data("Gold")
+        self._set_data(INSTRUMENTS[0]["name"])
 
     # -----------------------------
     def update_chart(self, key):
@@ -126,34 +149,22 @@ class AnimatedChart(QChartView):
 
         line = QLineSeries()
         line.setPen(
-            QPen(QColor(COLORS.get(key, "#9CA3AF")), 3, Qt.SolidLine, Qt.RoundCap)
+            QPen(QColor(COLORS.get(key, DEFAULT_COLOR)), 3, Qt.SolidLine, Qt.RoundCap)
         )
 
-        points = QScatterSeries()
-        points.setMarkerSize(10)
-        points.setColor(QColor(0, 0, 0, 0))     
-        points.setBorderColor(QColor(0, 0, 0, 0))
-
-        data = DATA[key]
-        times = DATA["Time"]
-
-        self.tooltip_data = []
+        times, values = DATA.series(key)
+        self.tooltip_x = local_msecs(times)
+        self.tooltip_times = times
+        self.tooltip_values = values
 
-        for t, v in zip(times, data):
-            dt = QDateTime.fromString(t, "yyyy-MM-dd HH:mm:ss")
-            x = dt.toMSecsSinceEpoch()
-
-            line.append(x, v)
-            points.append(x, v)
-
-            self.tooltip_data.append(
-                f"{dt.toString('MM-dd HH:mm')}\nValue: {v}"
-            )
-
-        points.hovered.connect(self._show_tooltip)
+        # Straight from the NumPy columns; per-point append is slow and
+        # leaks a reference to None on some PySide6 builds. Hover is taken
+        # from the line itself: an invisible scatter series for it made
+        # addSeries quadratic in the number of points
+        line.appendNp(self.tooltip_x, values.astype(np.float64))
+        line.hovered.connect(self._show_tooltip)
 
         self.chart.addSeries(line)
-        self.chart.addSeries(points)
 
         # -------- Axis X --------
         axis_x = QDateTimeAxis()
@@ -166,9 +177,10 @@ class AnimatedChart(QChartView):
         axis_y.setLabelsColor(QColor("#55585E"))
         axis_y.setGridLineColor(QColor("#EDEDF1"))
 
-        if data:
-            min_y = int(min(data))
-            max_y = int(max(data))
+        bounds = DATA.min_max(key)
+
+        if bounds:
+            min_y, max_y = bounds
             step = max((max_y - min_y) // 6, 1)
 
             for v in range(min_y, max_y + 1, step):
@@ -184,21 +196,23 @@ class AnimatedChart(QChartView):
 
         line.attachAxis(axis_x)
         line.attachAxis(axis_y)
-        points.attachAxis(axis_x)
-        points.attachAxis(axis_y)
 
     # -----------------------------
     def _show_tooltip(self, point, state):
-        if state:
-            index = self.sender().points().index(point)
-            if 0 <= index < len(self.tooltip_data):
-                QToolTip.showText(
-                    QCursor.pos(),
-                    self.tooltip_data[index],
-                    self,
-                    self.rect(),
-                    3000
-                )
+        if state and len(self.tooltip_x):
+            # Nearest stored point to the hovered spot on the line
+            index = int(np.searchsorted(self.tooltip_x, point.x()))
+            if index == len(self.tooltip_x) or (
+                index and point.x() - self.tooltip_x[index - 1] < self.tooltip_x[index] - point.x()
+            ):
+                index -= 1
+            QToolTip.showText(
+                QCursor.pos(),
+                f"{time_text(self.tooltip_times[index])[5:16]}\nValue: {self.tooltip_values[index]}",
+                self,
+                self.rect(),
+                3000
+            )
         else:
             QToolTip.hideText()
 
@@ -383,7 +397,7 @@ class MainWindow(QMainWindow):
 
         layout.setSpacing(12)
 
-        self.chart_title = QLabel("Gold Chart")
+        self.chart_title = QLabel(f"{INSTRUMENTS[0]['name']} Chart")
         self.chart_title.setStyleSheet(
             "font-weight: 600;background: transparent;border: none;font-size: 16px;color: #111827;padding-left: 40px;"
         )
@@ -410,6 +424,22 @@ class MainWindow(QMainWindow):
         coin_layout.setContentsMargins(20, 16, 20, 20)
         coin_layout.setSpacing(12)
 
+        list_layout = coin_layout
+        if len(buttons) > MAX_VISIBLE_BUTTONS:
+            list_widget = QWidget()
+            list_widget.setStyleSheet("background: transparent;")
+            list_layout = QVBoxLayout(list_widget)
+            list_layout.setContentsMargins(0, 0, 0, 0)
+            list_layout.setSpacing(12)
+
+            scroll = QScrollArea()
+            scroll.setWidgetResizable(True)
+            scroll.setFrameShape(QFrame.NoFrame)
+            scroll.setStyleSheet("background: transparent; border: none;")
+            scroll.setFixedHeight(MAX_VISIBLE_BUTTONS * 54)
+            scroll.setWidget(list_widget)
+            coin_layout.addWidget(scroll)
+
         group = QButtonGroup(self)
         group.setExclusive(True)
         
@@ -429,7 +459,7 @@ class MainWindow(QMainWindow):
             btn_widget.button.clicked.connect(
                 lambda _, n=name: self.chart_view.update_chart(n)
             )
-            coin_layout.addWidget(btn_widget)
+            list_layout.addWidget(btn_widget)
 
         group.buttons()[0].setChecked(True)
 
@@ -781,11 +811,14 @@ class MainWindow(QMainWindow):
 
 #! ---------- Run ----------
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # bulk decrypt workers in the frozen build
     backend.ensure_data_files()
     settings = backend.load_local_settings()
     if len(settings) > 4:
         backend.load_data(DATA,settings[4],settings[5])
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(backend.close_connections)
+    app.aboutToQuit.connect(backend.shutdown_pool)
     window = MainWindow()
     window.show()
     sys.exit(app.exec())
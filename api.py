@@ -0,0 +1,160 @@
+import hashlib
+import os
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# ===================== READ API =====================
+
+# GET /rows?since=2025-12-30&until=2025-12-31&instrument=Gold,USD
+#
+#   since      first timestamp to include (prefix of "YYYY-MM-DD HH:MM:SS")
+#   until      first timestamp to exclude
+#   instrument names or tgju ids, comma separated or repeated; default all
+#
+# Responds with decrypted CSV ("time,<names>"), chunked, gzip when accepted,
+# and an ETag over the store file and query so an up-to-date client gets a
+# bodiless 304. Rows are plaintext, so bind to localhost unless tunnelled.
+#
+# Only rows already in the store file are served: what the writer still
+# buffers (up to FLUSH_ROWS rows or FLUSH_INTERVAL seconds) and an open
+# change-only run show up after the next flush, and the ETag changes with
+# them. The API thread does not flush itself, since the writer belongs to
+# the collector loop and a block store would seal a block per request.
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, read_rows, store_path, instruments, logger=None):
+        super().__init__(address, ApiHandler)
+        self.read_rows = read_rows
+        self.store_path = store_path
+        self.instruments = instruments
+        self.logger = logger
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.logger:
+            self.server.logger.debug(f"API {self.address_string()} {format % args}")
+
+    def send_error_text(self, code, text):
+        body = (text + "\n").encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def select_instruments(self, query):
+        wanted = [
+            part.strip()
+            for value in query.get("instrument", [])
+            for part in value.split(",")
+            if part.strip()
+        ]
+        if not wanted:
+            return self.server.instruments
+
+        by_key = {}
+        for item in self.server.instruments:
+            by_key[item["name"]] = item
+            by_key[item["id"]] = item
+
+        unknown = [w for w in wanted if w not in by_key]
+        if unknown:
+            raise ValueError(f"Unknown instrument: {', '.join(unknown)}")
+        return [by_key[w] for w in wanted]
+
+    def make_etag(self, query_string):
+        path = self.server.store_path()
+        try:
+            stat = os.stat(path)
+            state = f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            state = "missing"
+        digest = hashlib.sha1(f"{path}|{state}|{query_string}".encode()).hexdigest()
+        return f'"{digest[:20]}"'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/rows":
+            self.send_error_text(404, "Not found")
+            return
+
+        query = parse_qs(url.query)
+        since = query.get("since", [None])[0]
+        until = query.get("until", [None])[0]
+        try:
+            selected = self.select_instruments(query)
+        except ValueError as e:
+            self.send_error_text(400, str(e))
+            return
+
+        etag = self.make_etag(url.query)
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Transfer-Encoding", "chunked")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        self.stream_rows(selected, since, until)
+
+    def write_chunk(self, data):
+        if self.compressor:
+            data = self.compressor.compress(data)
+        if data:
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    def stream_rows(self, selected, since, until):
+        ids = [item["id"] for item in selected]
+        lines = ["time," + ",".join(item["name"] for item in selected)]
+        size = len(lines[0])
+
+        for t, values in self.server.read_rows(since, until):
+            row = [t] + ["" if values.get(i) is None else str(values[i]) for i in ids]
+            line = ",".join(row)
+            lines.append(line)
+            size += len(line) + 1
+
+            if size >= CHUNK_SIZE:
+                self.write_chunk(("\n".join(lines) + "\n").encode("utf-8"))
+                lines, size = [], 0
+
+        if lines:
+            self.write_chunk(("\n".join(lines) + "\n").encode("utf-8"))
+        if self.compressor:
+            tail = self.compressor.flush()
+            if tail:
+                self.wfile.write(f"{len(tail):X}\r\n".encode() + tail + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_api(host, port, read_rows, store_path, instruments, logger=None):
+    # read_rows(since, until) yields (time, {id: price or None});
+    # store_path() names the file whose size/mtime drives the ETag
+    api = ApiServer((host, port), read_rows, store_path, instruments, logger)
+    thread = threading.Thread(target=api.serve_forever, name="api", daemon=True)
+    thread.start()
+
+    if logger:
+        logger.info(f"Read API listening on http://{host}:{api.server_port}/rows")
+    return api
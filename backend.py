@@ -1,6 +1,42 @@
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
-import base64, sys, os, paramiko
+import base64, gzip, json, socket, sys, os, paramiko, weakref
+import numpy as np
+
+from binstore import is_binary_store, read_columns
+from blockstore import is_block_store, iter_rows
+from bulkdecrypt import decode_lines, shutdown_pool
+from instruments import (
+    INSTRUMENTS_FILE,
+    LEGACY_COLUMNS,
+    decode_schema,
+    full_time,
+    is_schema_line,
+    load_instruments,
+    names_by_id,
+    time_to_int,
+)
+from localcache import append_cache, read_cache
+from pricestore import PriceStore
+from rollups import FIELDS, RESOLUTIONS, pick_resolution, rollup_path
+from segments import (
+    CATALOG_FILE,
+    SEGMENT_DIR,
+    file_digest,
+    is_segment_dir,
+    open_segment,
+    segment_paths,
+)
+
+REMOTE_PRICES = "/home/debian/Prices.csv"
+REMOTE_SEGMENTS = "/home/debian/segments"
+
+SYNC_STATE = "sync_state.json"
+SYNC_CHECK_BYTES = 4096
+SYNC_CHUNK = 1 << 20
+
+SFTP_KEEPALIVE = 30
+SFTP_TIMEOUT = 15
 
 client_key = "7acbe2c3a12c9fbf8a76cd1185dc874f8def2b8f0a81bf146ae39405a357ef79"
 client_iv = bytes.fromhex("b96808845430d3e213c059a6c9979f39")
@@ -18,6 +54,20 @@ def find_app_path(filename):
     return os.path.join(os.getcwd(), filename)
 
 
+INSTRUMENTS = load_instruments(find_app_path(INSTRUMENTS_FILE))
+
+
+# ===================== DATA =====================
+
+# DATA is a pricestore.PriceStore with one column per instrument name. It
+# keeps rows sorted by time and drops repeated timestamps on merge, so the
+# loaders below only collect columns and hand them over.
+
+
+def new_data(instruments=None):
+    return PriceStore(item["name"] for item in instruments or INSTRUMENTS)
+
+
 def encrypt_aes(text, key, iv):
     cipher = AES.new(bytes.fromhex(key), AES.MODE_CBC, iv)
     encrypted = cipher.encrypt(pad(text.encode("utf-8"), AES.block_size))
@@ -53,21 +103,208 @@ def try_decrypt(key, iv):
     return result
 
 
-def load_data(DATA, key, iv):
-    with open(find_app_path("Prices.csv"), "r", encoding="utf-8") as f:
-        encrypted_data = f.readlines()
-        for line in encrypted_data:
+def to_price(text):
+    # Empty column = instrument missing from that tick
+    return int(text) if text else None
+
+
+def in_span(t, since=None, until=None):
+    return (since is None or t >= since) and (until is None or t < until)
+
+
+def load_binary(DATA, path, instruments=None, since=None, until=None):
+    # Prices.bin is plain fixed-width int64: the mmap columns go to the
+    # store as arrays, no per-row Python
+    names = names_by_id(instruments or INSTRUMENTS)
+    ids, times, columns = read_columns(path)
+    times = np.asarray(times)
+
+    rows = np.ones(len(times), bool)
+    if since is not None:
+        rows &= times >= time_to_int(since)
+    if until is not None:
+        rows &= times < time_to_int(until)
+
+    DATA.merge(
+        times[rows],
+        {name: np.asarray(columns[item_id])[rows] for item_id, name in names.items() if item_id in columns},
+    )
+
+
+def load_blocks(DATA, path, key, instruments=None, since=None, until=None):
+    # Prices.gcm: one AES-GCM decrypt per block instead of one per row
+    names = names_by_id(instruments or INSTRUMENTS)
+    times, columns = [], {name: [] for name in names.values()}
+
+    for t, values in iter_rows(path, bytes.fromhex(key)):
+        if not in_span(t, since, until):
+            continue
+        times.append(t)
+        for item_id, name in names.items():
+            columns[name].append(to_price(values.get(item_id)))
+
+    DATA.merge(times, columns)
+
+
+def default_prices_path():
+    # A synced segments/ directory replaces the single Prices.csv
+    segments = find_app_path(SEGMENT_DIR)
+    return segments if is_segment_dir(segments) else find_app_path("Prices.csv")
+
+
+def load_data(DATA, key, iv, instruments=None, path=None, since=None, until=None):
+    path = path or default_prices_path()
+    since = full_time(since) if since is not None else None
+    until = full_time(until) if until is not None else None
+    if is_segment_dir(path):
+        # Only the segments overlapping [since, until) are opened
+        for segment in segment_paths(path, since, until):
+            load_csv_file(DATA, segment, key, iv, instruments, since, until)
+    elif is_binary_store(path):
+        load_binary(DATA, path, instruments, since, until)
+    elif is_block_store(path):
+        load_blocks(DATA, path, key, instruments, since, until)
+    else:
+        load_csv_file(DATA, path, key, iv, instruments, since, until)
+
+
+# ===================== LOAD CURSORS =====================
+
+# Where the last full load_data of a CSV file into a store stopped, so the
+# next load after a sync only decrypts the appended rows. DATA -> {(path,
+# key, iv): cursor}, held weakly so a dropped store takes its cursors with
+# it; dropped when sync replaces the file.
+CURSORS = weakref.WeakKeyDictionary()
+
+
+def new_cursor():
+    return {"offset": 0, "columns": LEGACY_COLUMNS, "encrypted": None, "last_time": None}
+
+
+def forget_cursors(path):
+    for cursors in list(CURSORS.values()):
+        for cursor_key in [k for k in cursors if k[0] == path]:
+            del cursors[cursor_key]
+
+
+def load_csv_file(DATA, path, key, iv, instruments=None, since=None, until=None):
+    # Range loads (load_span) read the whole file and leave no cursor
+    full = since is None and until is None
+    if full:
+        cursor = CURSORS.setdefault(DATA, {}).setdefault((path, key, iv), new_cursor())
+    else:
+        cursor = new_cursor()
+
+    names = names_by_id(instruments or INSTRUMENTS)
+    if not cursor["offset"]:
+        # Rows decrypted by an earlier run come from the local cache
+        load_cached(DATA, path, key, iv, names, cursor, since, until)
+
+    if path.endswith(".gz"):
+        # Closed segments never grow
+        if cursor["offset"]:
+            return
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+    else:
+        if os.path.getsize(path) < cursor["offset"]:
+            cursor.update(new_cursor())
+        with open(path, "rb") as f:
+            f.seek(cursor["offset"])
+            data = f.read()
+
+    # A torn last line is left for the next load
+    end = len(data) if path.endswith(".gz") else data.rfind(b"\n") + 1
+    if not end:
+        return
+    start = cursor["offset"]
+    columns = load_csv_lines(DATA, data[:end].decode("utf-8").splitlines(), key, iv, instruments, since, until, cursor)
+    cursor["offset"] += end
+
+    if full:
+        state = {name: cursor[name] for name in ("offset", "columns", "encrypted", "last_time")}
+        append_cache(path, key, iv, list(names), columns, start, state)
+
+
+def load_cached(DATA, path, key, iv, names, cursor, since=None, until=None):
+    cached = read_cache(path, key, iv, list(names))
+    if cached is None:
+        return
+
+    times, columns, state = cached
+    rows = np.ones(len(times), bool)
+    if since is not None:
+        rows &= times >= time_to_int(since)
+    if until is not None:
+        rows &= times < time_to_int(until)
+    DATA.merge(times[rows], {name: columns[item_id][rows] for item_id, name in names.items()})
+    cursor.update(state)
+
+
+def load_csv_lines(DATA, lines, key, iv, instruments=None, since=None, until=None, cursor=None):
+    # Decrypted in batches (in worker processes for big files), see bulkdecrypt
+    names = names_by_id(instruments or INSTRUMENTS)
+    cursor = cursor or new_cursor()
+    state = {name: cursor[name] for name in ("columns", "encrypted", "last_time")}
+
+    columns, state = decode_lines(list(lines), key, iv, list(names), state, since, until)
+    cursor.update(state)
+    merge_columns(DATA, columns, names)
+    return columns
+
+
+def merge_columns(DATA, columns, names):
+    # bulkdecrypt columns are keyed by id, the store by name
+    DATA.merge(columns["Time"], {name: columns[item_id] for item_id, name in names.items()})
+
+
+def load_rollup(DATA, key, iv, resolution, since=None, until=None, field="close", instruments=None):
+    # Prices_<res>.csv rows hold open,high,low,close,count per instrument;
+    # one of those fields is loaded per bucket
+    names = names_by_id(instruments or INSTRUMENTS)
+    offset = FIELDS.index(field)
+    width = len(FIELDS)
+    columns = []
+    times, prices = [], {name: [] for name in names.values()}
+
+    with open(find_app_path(rollup_path("Prices.csv", resolution)), "r", encoding="utf-8") as f:
+        for line in f:
             line = line.strip().split(",")
-            if line[0] not in DATA["Time"]:
-                DATA["Time"].append(line[0])
-                decrypted_line = decrypt_aes(line[1], key, bytes.fromhex(iv)).split(
-                    ","
-                )  # ?time
-                # print(decrypted_line)
-                DATA["Gold"].append(int(decrypted_line[2]))  # ?gold
-                DATA["Coin"].append(int(decrypted_line[3]))  # ?coin
-                DATA["USD"].append(int(decrypted_line[1]))  # ?usd
-                DATA["USDT"].append(int(decrypted_line[0]))  # ?usdt
+            if len(line) < 2:
+                continue
+
+            if is_schema_line(line):
+                columns = decode_schema(decrypt_aes(line[1], key, bytes.fromhex(iv)))
+                continue
+
+            t = line[0]
+            if not in_span(t, since, until):
+                continue
+
+            values = decrypt_aes(line[1], key, bytes.fromhex(iv)).split(",")
+            by_id = {
+                item_id: values[n * width + offset] for n, item_id in enumerate(columns)
+            }
+
+            times.append(t)
+            for item_id, name in names.items():
+                prices[name].append(to_price(by_id.get(item_id)))
+
+    DATA.merge(times, prices)
+
+
+def load_span(DATA, key, iv, since, until, max_points=2000, instruments=None):
+    # Loads the coarsest detail the chart needs for [since, until): raw rows
+    # for short spans, otherwise the finest rollup with <= max_points buckets
+    since, until = full_time(since), full_time(until)
+    resolution = pick_resolution(time_to_int(until) - time_to_int(since), max_points)
+
+    if resolution and os.path.exists(find_app_path(rollup_path("Prices.csv", resolution))):
+        load_rollup(DATA, key, iv, resolution, since, until, instruments=instruments)
+        return resolution
+
+    load_data(DATA, key, iv, instruments, since=since, until=until)
+    return None
 
 
 def load_local_settings():
@@ -93,24 +330,258 @@ def add_server_key_iv_tosettings(key, iv):
         f.write(encrypt_aes(",".join(settings), client_key, client_iv))
 
 
+def remote_exists(sftp, path):
+    try:
+        sftp.stat(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+# ===================== INCREMENTAL SYNC =====================
+
+# Prices.csv, the rollups and the active segment are append-only on the
+# server. sync_state.json keeps the size of every file after its last
+# complete sync; the next sync checks that the local copy is still a prefix
+# of the remote file (first and last SYNC_CHECK_BYTES) and fetches only the
+# bytes past it. A remote file that shrank or no longer matches (key change,
+# server reset) is downloaded whole.
+
+
+def load_sync_state():
+    path = find_app_path(SYNC_STATE)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def save_sync_state(state):
+    path = find_app_path(SYNC_STATE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def is_prefix(src, local, size):
+    # Compares the head and the bytes just before the resume offset
+    head = min(SYNC_CHECK_BYTES, size)
+    tail = min(SYNC_CHECK_BYTES, size - head)
+    ranges = [(0, head)] + ([(size - tail, tail)] if tail else [])
+
+    with open(local, "rb") as f:
+        for (offset, length), remote_bytes in zip(ranges, src.readv(ranges)):
+            f.seek(offset)
+            if f.read(length) != remote_bytes:
+                return False
+    return True
+
+
+def download_full(sftp, remote, local):
+    sftp.get(remote, local + ".part")
+    os.replace(local + ".part", local)
+    forget_cursors(local)
+
+
+def sync_file(sftp, remote, local, state):
+    # Returns the number of bytes fetched
+    size = sftp.stat(remote).st_size
+    known = state.get(remote)
+    have = os.path.getsize(local) if os.path.isfile(local) else 0
+
+    if known and known["local"] == local and 0 < known["size"] <= min(size, have):
+        # Bytes past the recorded size are from an interrupted append
+        if have > known["size"]:
+            with open(local, "r+b") as f:
+                f.truncate(known["size"])
+            have = known["size"]
+
+        with sftp.open(remote, "rb") as src:
+            if is_prefix(src, local, have):
+                src.seek(have)
+                src.prefetch(size)
+                with open(local, "ab") as dst:
+                    remaining = size - have
+                    while remaining:
+                        chunk = src.read(min(SYNC_CHUNK, remaining))
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        remaining -= len(chunk)
+                fetched = size - have - remaining
+                state[remote] = {"local": local, "size": have + fetched}
+                save_sync_state(state)
+                return fetched
+
+    download_full(sftp, remote, local)
+    state[remote] = {"local": local, "size": os.path.getsize(local)}
+    save_sync_state(state)
+    return state[remote]["size"]
+
+
+def closed_current(entry, local, known):
+    # A closed segment is rewritten whole by a key rotation, usually to the
+    # same size, so the catalog digest decides. Catalogs from before the
+    # digest was recorded only have the size.
+    if not os.path.isfile(local):
+        return False
+    if "sha256" not in entry:
+        return os.path.getsize(local) == entry.get("bytes")
+    return bool(known) and known["local"] == local and known.get("sha256") == entry["sha256"]
+
+
+def sync_segments(sftp, state):
+    # Closed segments never change: only new ones are fetched, and the
+    # active one incrementally
+    local_dir = find_app_path(SEGMENT_DIR)
+    os.makedirs(local_dir, exist_ok=True)
+    catalog_path = os.path.join(local_dir, CATALOG_FILE)
+
+    sftp.get(f"{REMOTE_SEGMENTS}/{CATALOG_FILE}", catalog_path + ".tmp")
+    with open(catalog_path + ".tmp", "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+
+    for entry in catalog["segments"]:
+        remote = f"{REMOTE_SEGMENTS}/{entry['name']}"
+        local = os.path.join(local_dir, entry["name"])
+        try:
+            if not entry["closed"]:
+                sync_file(sftp, remote, local, state)
+            elif not closed_current(entry, local, state.get(remote)):
+                download_full(sftp, remote, local)
+                state[remote] = {"local": local, "sha256": file_digest(local)}
+        except FileNotFoundError:
+            continue  # rolled over since the catalog was read; next sync gets it
+
+        # The plain copy of a segment that has been closed since
+        if entry["closed"] and local.endswith(".gz") and os.path.isfile(local[:-3]):
+            os.remove(local[:-3])
+            forget_cursors(local[:-3])
+            state.pop(remote[:-3], None)
+
+    os.replace(catalog_path + ".tmp", catalog_path)
+    save_sync_state(state)
+
+
+# ===================== SFTP CONNECTIONS =====================
+
+# One authenticated transport + SFTP channel per server, kept open with
+# SSH keepalives between syncs so a Download click (or a periodic sync)
+# skips the key exchange and password auth. A dropped connection is
+# reopened and the sync retried once; sync_file resumes where it stopped.
+
+# Errors a dead connection raises. Other OSErrors (a missing remote file,
+# a full local disk) count only if the channel turns out to be closed.
+DROPPED = (EOFError, ConnectionError, socket.timeout, paramiko.SSHException)
+
+
+class SftpConnection:
+    def __init__(self, host, port, username, password, keepalive=SFTP_KEEPALIVE):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.transport = None
+        self.sftp = None
+
+    def is_active(self):
+        return self.transport is not None and self.transport.is_active()
+
+    def connect(self):
+        self.close()
+        sock = socket.create_connection((self.host, self.port), SFTP_TIMEOUT)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.connect(username=self.username, password=self.password)
+            transport.set_keepalive(self.keepalive)
+            self.sftp = paramiko.SFTPClient.from_transport(transport)
+            self.sftp.get_channel().settimeout(SFTP_TIMEOUT)
+        except Exception:
+            transport.close()
+            raise
+        self.transport = transport
+
+    def client(self):
+        if not self.is_active():
+            self.connect()
+        return self.sftp
+
+    def is_dropped(self, error):
+        if isinstance(error, DROPPED):
+            return True
+        return not self.is_active() or self.sftp.get_channel().closed
+
+    def run(self, func):
+        # Only a reused connection can have dropped while idle
+        reused = self.is_active()
+        sftp = self.client()
+        try:
+            return func(sftp)
+        except (EOFError, OSError, paramiko.SSHException) as e:
+            if not reused or not self.is_dropped(e):
+                raise
+            self.connect()
+            return func(self.sftp)
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = self.sftp = None
+
+
+CONNECTIONS = {}
+
+
+def get_connection(host, port, username, password):
+    address = (host, int(port), username)
+    connection = CONNECTIONS.get(address)
+    if connection is None or connection.password != password:
+        if connection is not None:
+            connection.close()
+        connection = CONNECTIONS[address] = SftpConnection(host, int(port), username, password)
+    return connection
+
+
+def close_connections():
+    for connection in CONNECTIONS.values():
+        connection.close()
+    CONNECTIONS.clear()
+
+
+def sync_all(sftp):
+    state = load_sync_state()
+    if remote_exists(sftp, f"{REMOTE_SEGMENTS}/{CATALOG_FILE}"):
+        sync_segments(sftp, state)
+    else:
+        sync_file(sftp, REMOTE_PRICES, find_app_path("Prices.csv"), state)
+    for name in RESOLUTIONS:
+        try:
+            sync_file(sftp, rollup_path(REMOTE_PRICES, name), find_app_path(rollup_path("Prices.csv", name)), state)
+        except FileNotFoundError:
+            pass  # server without rollups
+
+
 def download_via_sftp(enter, key, iv):
     result = ""
     try:
         row = enter.split(",")
-        transport = paramiko.Transport((row[0], int(row[1])))
-        transport.connect(username=row[2], password=row[3])
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        sftp.get("/home/debian/Prices.csv", find_app_path("Prices.csv"))
-        sftp.close()
-        transport.close()
+        get_connection(*row[:4]).run(sync_all)
         result = (True, 1)
     except Exception as e:
         result = (False, 2)
     if result[0]:
         try:
-            with open(find_app_path("Prices.csv"), "r", encoding="utf-8") as f:
-                encrypted_data = f.readlines()
-                for line in encrypted_data:
+            path = default_prices_path()
+            if is_segment_dir(path):
+                path = segment_paths(path)[-1]
+            with open_segment(path) as f:
+                for line in f:
                     line = line.strip().split(",")
                     decrypted_line = decrypt_aes(line[1], key, bytes.fromhex(iv))
                     add_server_key_iv_tosettings(key, iv)
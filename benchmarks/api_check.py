@@ -0,0 +1,140 @@
+import gzip
+import http.client
+import os
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+# Read API check: serves a generated Prices.csv (with a torn last line, as
+# while the writer appends) on localhost and checks since/until filtering,
+# the gzip encoding and the ETag 304 path:
+#
+#   python benchmarks/api_check.py
+#
+# Exits non-zero and lists the failures otherwise.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_suite import START_TIME, STEP, make_prices_csv
+
+ROWS = 3000  # a bit over two days of minutes, several chunks
+TORN = 40  # bytes of the next row already appended
+
+
+def next_row(server, n):
+    from instruments import int_to_time
+
+    values = ",".join(str(100_000 + k) for k in range(len(server.ITEM_IDS)))
+    return f"{int_to_time(START_TIME + n * STEP)},{server.encrypt_data(values)}\n"
+
+
+def get(base, query, headers=None):
+    request = urllib.request.Request(f"{base}/rows?{urlencode(query)}", headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            try:
+                return response.status, dict(response.headers), response.read()
+            except http.client.IncompleteRead as e:
+                # The stream broke off mid-response
+                return -1, dict(response.headers), e.partial
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def times_of(body):
+    lines = body.decode("utf-8").splitlines()
+    return lines[0], [line.split(",", 1)[0] for line in lines[1:]]
+
+
+def check(server, base):
+    from instruments import int_to_time
+
+    failures = []
+
+    def expect(ok, text):
+        if not ok:
+            failures.append(text)
+
+    all_times = [int_to_time(START_TIME + n * STEP) for n in range(ROWS)]
+
+    status, _, body = get(base, {})
+    header, times = times_of(body)
+    expect(status == 200, f"all rows: status {status}")
+    expect(header == "time," + ",".join(item["name"] for item in server.INSTRUMENTS),
+           f"all rows: header {header[:60]!r}")
+    expect(times == all_times, f"all rows: {len(times)} rows, expected {ROWS} (torn line served?)")
+
+    since, until = all_times[1000], all_times[1500]
+    status, _, body = get(base, {"since": since, "until": until})
+    expect(times_of(body)[1] == all_times[1000:1500],
+           f"since/until: {len(times_of(body)[1])} rows, expected 500")
+
+    day = all_times[0][:10]
+    status, _, body = get(base, {"since": day, "until": all_times[1440][:10]})
+    expect(times_of(body)[1] == all_times[:1440], "since/until by day: wrong rows")
+
+    name = server.INSTRUMENTS[0]["name"]
+    status, _, body = get(base, {"instrument": name, "until": all_times[10]})
+    expect(times_of(body)[0] == f"time,{name}", f"instrument: header {times_of(body)[0]!r}")
+
+    status, _, body = get(base, {"instrument": "NoSuchThing"})
+    expect(status == 400, f"unknown instrument: status {status}")
+
+    query = {"since": since, "until": until}
+    plain = get(base, query)[2]
+    status, headers, body = get(base, query, {"Accept-Encoding": "gzip"})
+    expect(headers.get("Content-Encoding") == "gzip", "gzip: no Content-Encoding")
+    try:
+        expect(gzip.decompress(body) == plain, "gzip: body differs from the plain response")
+    except OSError as e:
+        failures.append(f"gzip: {e}")
+
+    etag = headers.get("ETag")
+    status, headers, body = get(base, query, {"If-None-Match": etag})
+    expect(status == 304 and not body, f"ETag: status {status} with {len(body)} bytes")
+    expect(headers.get("ETag") == etag, "ETag: 304 without the same ETag")
+
+    # Finishing the torn row serves it, and the file change moves the ETag
+    with open(server.FILE_NAME, "a", encoding="utf-8") as f:
+        f.write(next_row(server, ROWS)[TORN:])
+    status, _, _ = get(base, query, {"If-None-Match": etag})
+    expect(status == 200, f"ETag after append: status {status}")
+    times = times_of(get(base, {"since": all_times[-1]})[2])[1]
+    expect(times == [all_times[-1], int_to_time(START_TIME + ROWS * STEP)],
+           f"completed row: got {times}")
+    return failures
+
+
+def main():
+    # server.py works in the current directory
+    with tempfile.TemporaryDirectory(prefix="gcpms-api-") as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import server
+            from api import start_api
+
+            server.logger.setLevel("WARNING")
+            make_prices_csv(server, server.FILE_NAME, ROWS)
+            with open(server.FILE_NAME, "a", encoding="utf-8") as f:
+                f.write(next_row(server, ROWS)[:TORN])
+
+            api = start_api("127.0.0.1", 0, server.read_rows, server.store_path, server.INSTRUMENTS)
+            try:
+                failures = check(server, f"http://127.0.0.1:{api.server_port}")
+            finally:
+                api.shutdown()
+        finally:
+            os.chdir(cwd)
+
+    if failures:
+        print("FAIL\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"ok: {ROWS} rows, since/until, gzip and 304 over the read API")
+
+
+if __name__ == "__main__":
+    main()
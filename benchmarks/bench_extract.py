@@ -0,0 +1,66 @@
+import glob
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extractor
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Same ids server.py collects every tick
+SERVER_IDS = [
+    "l-crypto-tether-irr",
+    "l-price_dollar_rl",
+    "l-geram18",
+    "l-sekee",
+]
+
+ALL_IDS_RE = re.compile(r"<li\b[^>]*?\sid=[\"']([^\"']+)[\"']")
+
+
+def best_of(func, repeat=5, number=10):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def run_fixture(path):
+    with open(path, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    all_ids = ALL_IDS_RE.findall(html)
+    ok = True
+
+    for label, item_ids in (("server ids", SERVER_IDS), ("all ids", all_ids)):
+        same, fast, slow = extractor.verify(html, item_ids)
+        if not same:
+            ok = False
+            diff = {
+                k: (fast.get(k), slow.get(k))
+                for k in set(fast) | set(slow)
+                if fast.get(k) != slow.get(k)
+            }
+            print(f"  MISMATCH ({label}): {diff}")
+
+        fast_t = best_of(lambda: extractor.extract_fast(html, item_ids))
+        slow_t = best_of(lambda: extractor.extract_bs4(html, item_ids), number=3)
+
+        print(
+            f"  {label:<10} {len(item_ids):>4} ids | "
+            f"bs4 {slow_t * 1000:8.2f} ms | fast {fast_t * 1000:8.3f} ms | "
+            f"x{slow_t / fast_t:,.0f} | {'same output' if same else 'DIFFERENT'}"
+        )
+
+    return ok
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURES, "*.html")))
+    all_ok = True
+
+    for path in paths:
+        print(f"{os.path.basename(path)} ({os.path.getsize(path) // 1024} KiB)")
+        all_ok = run_fixture(path) and all_ok
+
+    sys.exit(0 if all_ok else 1)
@@ -0,0 +1,295 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+# Offline benchmarks for the scraper, crypto, storage, load and chart paths.
+#
+#   python benchmarks/bench_suite.py                    # 10k, 100k, 1M rows
+#   python benchmarks/bench_suite.py --sizes 10000 --out quick.json
+#   python benchmarks/bench_suite.py --compare benchmarks/results/<old>.json
+#
+# server.py creates config.json, logs and data files in its working
+# directory, so everything runs inside a temporary directory.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "tgju_home.html")
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+START_TIME = 1735689600  # 2025-01-01 00:00:00
+STEP = 60
+
+
+class Timeout(BaseException):
+    # Not an Exception, so the broad excepts in backend cannot swallow it
+    pass
+
+
+def on_alarm(signum, frame):
+    raise Timeout()
+
+
+def run_once(func, limit):
+    # Single timed call, abandoned after limit seconds where SIGALRM exists
+    use_alarm = limit and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, on_alarm)
+        signal.alarm(int(limit))
+    try:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+    except Timeout:
+        return None
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+def best_of(func, repeat=5, number=100):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ===================== SYNTHETIC DATA =====================
+
+
+def price_walk(rng, ids, rows):
+    # Random walk per instrument with the odd missing price
+    prices = {i: rng.randint(50_000, 500_000_000) for i in ids}
+    for _ in range(rows):
+        for i in ids:
+            prices[i] = max(1, prices[i] + rng.randint(-500, 500))
+        yield [None if rng.random() < 0.001 else prices[i] for i in ids]
+
+
+def make_prices_csv(server, path, rows, seed=1):
+    from instruments import SCHEMA_TAG, encode_schema, int_to_time
+
+    ids = server.ITEM_IDS
+    rng = random.Random(seed)
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        f.write(f"{SCHEMA_TAG},{server.encrypt_data(encode_schema(ids))}\n")
+        for n, values in enumerate(price_walk(rng, ids, rows)):
+            raw = ",".join("" if v is None else str(v) for v in values)
+            f.write(f"{int_to_time(START_TIME + n * STEP)},{server.encrypt_data(raw)}\n")
+
+
+# ===================== BENCHMARKS =====================
+
+
+def bench_micro(server, backend, html, results):
+    ids = server.ITEM_IDS
+    row = ",".join(str(100_000 + n) for n in range(len(ids)))
+    encrypted = server.encrypt_data(row)
+    key_hex, iv = server.key.hex(), server.iv
+
+    # fetch_price with the download replaced by the saved page
+    server.fetch_page = lambda url=None, source="tgju", timeout=None: html
+    results.append(
+        {"name": "server.fetch_price", "seconds": best_of(lambda: server.fetch_price(ids[0]))}
+    )
+    results.append(
+        {"name": "server.fetch_snapshot", "items": len(ids),
+         "seconds": best_of(lambda: server.fetch_snapshot(ids))}
+    )
+
+    results.append(
+        {"name": "server.encrypt_data", "seconds": best_of(lambda: server.encrypt_data(row), number=2000)}
+    )
+    results.append(
+        {"name": "backend.decrypt_aes",
+         "seconds": best_of(lambda: backend.decrypt_aes(encrypted, key_hex, iv), number=2000)}
+    )
+
+    # Per row, decrypting 1000 rows in one batch
+    import bulkdecrypt
+
+    batch = [encrypted] * 1000
+    results.append(
+        {"name": "bulkdecrypt.decrypt_many", "items": len(batch),
+         "seconds": best_of(lambda: bulkdecrypt.decrypt_many(batch, server.key, iv), number=20) / len(batch)}
+    )
+
+    path = os.path.abspath("write_bench.csv")
+    results.append(
+        {"name": "server.write_to_csv",
+         "seconds": best_of(lambda: server.write_to_csv(path, ["2025-01-01 00:00:00", encrypted]), number=200)}
+    )
+    os.remove(path)
+
+
+def bench_sizes(server, backend, Main, sizes, limit, results):
+    key_hex, iv_hex = server.key.hex(), server.iv.hex()
+    chart = Main.AnimatedChart()
+    name = Main.INSTRUMENTS[0]["name"]
+
+    for rows in sizes:
+        path = os.path.abspath(f"Prices_{rows}.csv")
+        start = time.perf_counter()
+        make_prices_csv(server, path, rows)
+        print(f"  generated {rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        data = backend.new_data(Main.INSTRUMENTS)
+        seconds = run_once(lambda: backend.load_data(data, key_hex, iv_hex, path=path), limit)
+        results.append(
+            {"name": "backend.load_data", "rows": rows, "seconds": seconds,
+             "file_bytes": os.path.getsize(path)}
+        )
+        report(results[-1])
+
+        if seconds is not None:
+            # Restart: rows come back from the decrypted cache
+            backend.CURSORS.clear()
+            cached = backend.new_data(Main.INSTRUMENTS)
+            results.append(
+                {"name": "backend.load_data (cached)", "rows": rows,
+                 "seconds": run_once(lambda: backend.load_data(cached, key_hex, iv_hex, path=path), limit)}
+            )
+            report(results[-1])
+
+        if seconds is None:
+            # Partial load; chart the same row count from a fresh walk instead
+            data = synthetic_data(Main.INSTRUMENTS, rows)
+
+        Main.DATA = data
+        seconds = run_once(lambda: chart._set_data(name), limit)
+        results.append({"name": "AnimatedChart._set_data", "rows": rows, "seconds": seconds})
+        report(results[-1])
+
+        os.remove(path)
+
+
+def synthetic_data(instruments, rows):
+    import numpy as np
+    from pricestore import PriceStore
+
+    ids = [item["id"] for item in instruments]
+    data = PriceStore(item["name"] for item in instruments)
+    columns = list(zip(*price_walk(random.Random(1), ids, rows)))
+    data.merge(
+        START_TIME + STEP * np.arange(rows),
+        {item["name"]: column for item, column in zip(instruments, columns)},
+    )
+    return data
+
+
+# ===================== REPORT =====================
+
+
+def report(result):
+    label = result["name"] + (f" [{result['rows']:,} rows]" if "rows" in result else "")
+    if result["seconds"] is None:
+        print(f"  {label:<45} timed out")
+    elif "rows" in result:
+        print(f"  {label:<45} {result['seconds']:10.3f} s")
+    else:
+        print(f"  {label:<45} {result['seconds'] * 1e6:10.1f} us/op")
+
+
+def result_key(result):
+    return (result["name"], result.get("rows"))
+
+
+def compare(old_path, results):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = {result_key(r): r["seconds"] for r in json.load(f)["results"]}
+
+    print(f"\nvs {os.path.basename(old_path)} (new/old, >1 is slower)")
+    for result in results:
+        before = old.get(result_key(result))
+        if before and result["seconds"]:
+            label = result["name"] + (f" [{result['rows']:,}]" if result.get("rows") else "")
+            print(f"  {label:<45} x{result['seconds'] / before:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GCPMS offline benchmark suite")
+    parser.add_argument(
+        "--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+        help="comma separated Prices.csv row counts",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600,
+        help="seconds before a single large benchmark is recorded as timed out",
+    )
+    parser.add_argument("--out", help="JSON result path (default benchmarks/results/<rev>.json)")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    revision = git_revision()
+    out = os.path.abspath(args.out or os.path.join(RESULTS, f"{revision}.json"))
+
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="gcpms-bench-") as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import server
+            import backend
+            import Main
+            from PySide6.QtWidgets import QApplication
+
+            server.logger.setLevel("WARNING")
+            app = QApplication.instance() or QApplication([])
+
+            print("micro")
+            bench_micro(server, backend, html, results)
+            for result in results:
+                report(result)
+
+            print("sizes")
+            bench_sizes(server, backend, Main, sizes, args.timeout, results)
+        finally:
+            os.chdir(cwd)
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "revision": revision,
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "sizes": sizes,
+                "timeout": args.timeout,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nwrote {out}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
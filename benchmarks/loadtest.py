@@ -0,0 +1,372 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Replay / load test: serves a tgju stand-in on localhost and runs server.py
+# against it on a simulated clock, e.g. 6 simulated hours of 60 s ticks at
+# 120x take 3 real minutes:
+#
+#   python benchmarks/loadtest.py --hours 6 --interval 60 --speed 120
+#   python benchmarks/loadtest.py --hours 24 --interval 10 --speed 2000 \
+#       --latency 0.2 --jitter 0.1 --error-rate 0.05 --out load.json
+#
+# Latency and jitter are real seconds, while a tick lasts interval / speed
+# real seconds, so keep latency well below that or every tick will miss.
+# The collector runs in its own process inside a temporary directory and is
+# stopped with SIGTERM, so its final flush is part of the measured sizes.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "tgju_home.html")
+SERVER = os.path.join(ROOT, "server.py")
+
+sys.path.insert(0, ROOT)
+
+from extractor import LI_END, LI_RE, PRICE_RE, to_int
+
+
+# ===================== STUB PAGE =====================
+
+
+class StubPage:
+    # The fixture split around every item's price, so a new page is a join.
+    # Prices take a random walk; each request moves them with change_rate
+    # probability, otherwise the page (and its ETag) stays the same.
+
+    def __init__(self, html, change_rate=1.0, seed=1):
+        self.parts, self.prices = [], []
+        self.change_rate = change_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        pos = 0
+        for match in LI_RE.finditer(html):
+            end = html.find(LI_END, match.end())
+            price = PRICE_RE.search(html, match.end(), end if end != -1 else len(html))
+            if not price:
+                continue
+            try:
+                value = to_int(price.group(1))
+            except ValueError:
+                continue
+            self.parts.append(html[pos:price.start(1)])
+            self.prices.append(value)
+            pos = price.end(1)
+        self.parts.append(html[pos:])
+
+        self.version = 0
+        self.render()
+
+    def render(self):
+        body = []
+        for part, price in zip(self.parts, self.prices):
+            body += [part, f"{price:,}"]
+        body.append(self.parts[-1])
+        self.body = "".join(body).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, 6)
+        self.etag = f'"v{self.version}"'
+
+    def step(self):
+        with self.lock:
+            if self.rng.random() < self.change_rate:
+                self.prices = [
+                    max(1, p + self.rng.randint(-max(1, p // 1000), max(1, p // 1000)))
+                    for p in self.prices
+                ]
+                self.version += 1
+                self.render()
+            return self.body, self.gzipped, self.etag
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, page, latency, jitter, error_rate, seed=1):
+        super().__init__(address, StubHandler)
+        self.page = page
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.statuses = {}
+        self.service_times = []
+        self.bytes_sent = 0
+
+    def record(self, status, seconds, size):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.service_times.append(seconds)
+            self.bytes_sent += size
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        start = time.perf_counter()
+
+        delay = max(0.0, server.latency + server.rng.uniform(-server.jitter, server.jitter))
+        time.sleep(delay)
+
+        if server.rng.random() < server.error_rate:
+            status, body, headers = 503, b"busy", [("Content-Type", "text/plain")]
+        else:
+            plain, gzipped, etag = server.page.step()
+            if etag == self.headers.get("If-None-Match"):
+                status, body, headers = 304, b"", [("ETag", etag)]
+            else:
+                headers = [("Content-Type", "text/html; charset=utf-8"), ("ETag", etag)]
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzipped
+                    headers.append(("Content-Encoding", "gzip"))
+                else:
+                    body = plain
+                status = 200
+
+        self.reply(status, body, headers)
+        server.record(status, time.perf_counter() - start, len(body))
+
+
+def start_stub(page, latency, jitter, error_rate):
+    stub = StubServer(("127.0.0.1", 0), page, latency, jitter, error_rate)
+    threading.Thread(target=stub.serve_forever, name="stub", daemon=True).start()
+    return stub
+
+
+# ===================== MEASURE =====================
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def scrape(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+            return r.read().decode("utf-8")
+    except OSError:
+        return ""
+
+
+BUCKET_RE = re.compile(r'^(\w+)_bucket\{(?:[^}]*,)?le="([^"]+)"\} (\S+)$')
+
+
+def histogram_percentiles(text, name, quantiles=(50, 90, 99)):
+    # Upper bucket bound holding each quantile, summed over all label sets
+    buckets = {}
+    for line in text.splitlines():
+        match = BUCKET_RE.match(line)
+        if match and match.group(1) == name:
+            le = float("inf") if match.group(2) == "+Inf" else float(match.group(2))
+            buckets[le] = buckets.get(le, 0) + float(match.group(3))
+
+    if not buckets or not buckets.get(float("inf")):
+        return {}
+    total = buckets[float("inf")]
+    result = {}
+    for q in quantiles:
+        for le in sorted(buckets):
+            if buckets[le] >= total * q / 100:
+                result[f"p{q}"] = le
+                break
+    return result
+
+
+def metric_total(text, name):
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def data_lines(path):
+    if not os.path.isfile(path):
+        return 0
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip() and not line.startswith(b"#"))
+
+
+def file_sizes(directory):
+    return {
+        name: os.path.getsize(os.path.join(directory, name))
+        for name in sorted(os.listdir(directory))
+        if name.startswith("Prices") or name.startswith("server_log")
+    }
+
+
+# ===================== RUN =====================
+
+
+def run(args):
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        page = StubPage(f.read(), args.change_rate)
+    stub = start_stub(page, args.latency, args.jitter, args.error_rate)
+    url = f"http://127.0.0.1:{stub.server_port}/"
+
+    real_seconds = args.hours * 3600 / args.speed
+    period = args.interval / args.speed
+    if args.latency + args.jitter >= period * 0.9:
+        print(f"warning: stub latency exceeds the {period * 1000:.0f}ms real tick period")
+    metrics_port = free_port()
+    print(
+        f"stub {url} ({len(page.prices)} items), {args.hours} simulated hours "
+        f"of {args.interval}s ticks at {args.speed:g}x = {real_seconds:.0f}s real"
+    )
+
+    with tempfile.TemporaryDirectory(prefix="gcpms-load-") as tmp:
+        env = dict(
+            os.environ,
+            GCPMS_URL=url,
+            GCPMS_TIME_SCALE=str(args.speed),
+            GCPMS_TICK_INTERVAL=str(args.interval),
+            GCPMS_API_PORT="0",
+            GCPMS_METRICS_PORT=str(metrics_port),
+            GCPMS_WORKERS=str(args.workers),
+        )
+        if args.sources > 1:
+            with open(os.path.join(tmp, "sources.json"), "w", encoding="utf-8") as f:
+                json.dump(
+                    [{"name": f"stub{n}", "url": f"{url}?s={n}"} for n in range(args.sources)], f
+                )
+        log = open(os.path.join(tmp, "stdout.log"), "w")
+        proc = subprocess.Popen(
+            [sys.executable, SERVER], cwd=tmp, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+        samples = []
+        start = time.monotonic()
+        metrics_text = ""
+        try:
+            while time.monotonic() - start < real_seconds:
+                time.sleep(min(1.0, real_seconds / 20))
+                if proc.poll() is not None:
+                    raise RuntimeError(f"collector exited with {proc.returncode}, see {log.name}")
+                sizes = file_sizes(tmp)
+                samples.append(
+                    {"real": round(time.monotonic() - start, 2), "bytes": sum(sizes.values())}
+                )
+            metrics_text = scrape(metrics_port)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+            stub.shutdown()
+
+        elapsed = time.monotonic() - start
+        sizes = file_sizes(tmp)
+        rows = data_lines(os.path.join(tmp, "Prices.csv"))
+
+    ticks_expected = int(args.hours * 3600 / args.interval)
+    store = sizes.get("Prices.csv", 0)
+    bytes_per_row = store / rows if rows else None
+
+    return {
+        "config": vars(args),
+        "real_seconds": round(elapsed, 2),
+        "ticks_expected": ticks_expected,
+        "rows": rows,
+        "rows_per_real_second": round(rows / elapsed, 2),
+        "tick_errors": metric_total(metrics_text, "gcpms_tick_errors_total"),
+        "tick_overruns": metric_total(metrics_text, "gcpms_tick_overruns_total"),
+        "ticks_skipped": metric_total(metrics_text, "gcpms_ticks_skipped_total"),
+        "requests": stub.statuses,
+        "stub_bytes_sent": stub.bytes_sent,
+        "stub_service_seconds": {
+            f"p{q}": percentile(stub.service_times, q) for q in (50, 90, 99)
+        },
+        "fetch_seconds": histogram_percentiles(metrics_text, "gcpms_fetch_seconds"),
+        "parse_seconds": histogram_percentiles(metrics_text, "gcpms_parse_seconds"),
+        "tick_seconds": histogram_percentiles(metrics_text, "gcpms_tick_seconds"),
+        "files": sizes,
+        "bytes_per_row": bytes_per_row,
+        "projected_bytes_per_day": (
+            round(bytes_per_row * 86400 / args.interval) if bytes_per_row else None
+        ),
+        "growth": samples,
+    }
+
+
+def print_report(result):
+    print(f"\nrows {result['rows']} / {result['ticks_expected']} ticks "
+          f"in {result['real_seconds']}s real ({result['rows_per_real_second']} rows/s)")
+    print(f"tick errors {result['tick_errors']:.0f}, overruns {result['tick_overruns']:.0f}, "
+          f"skipped {result['ticks_skipped']:.0f}")
+    print(f"stub responses {result['requests']}")
+    for name in ("stub_service_seconds", "fetch_seconds", "parse_seconds", "tick_seconds"):
+        values = ", ".join(
+            f"{q} {v * 1000:.1f}ms" if v not in (None, float("inf")) else f"{q} >max"
+            for q, v in result[name].items()
+        )
+        print(f"{name:<22} {values or 'n/a'}")
+    for name, size in result["files"].items():
+        print(f"  {name:<24} {size:>12,} B")
+    if result["bytes_per_row"]:
+        print(f"{result['bytes_per_row']:.1f} B/row, "
+              f"~{result['projected_bytes_per_day'] / 1024:,.0f} KiB/day at this interval")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GCPMS collector load test")
+    parser.add_argument("--hours", type=float, default=6, help="simulated hours")
+    parser.add_argument("--interval", type=float, default=60, help="simulated tick seconds")
+    parser.add_argument("--speed", type=float, default=120, help="simulated seconds per real second")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response delay, seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="+/- uniform delay, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 replies")
+    parser.add_argument("--change-rate", type=float, default=1.0,
+                        help="chance prices move per request; otherwise a 304 is possible")
+    parser.add_argument("--sources", type=int, default=1, help="stub sources fetched per tick")
+    parser.add_argument("--workers", type=int, default=0, help="collector worker processes")
+    parser.add_argument("--fixture", default=FIXTURE, help="recorded tgju page to replay")
+    parser.add_argument("--out", help="write the full result as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# In-process metrics check: runs the collector against the load-test stub
+# until one tick is written, stops it, and reads REGISTRY directly:
+#
+#   python benchmarks/metrics_check.py
+#   python benchmarks/metrics_check.py --storage block --workers 2
+#
+# Exits non-zero and lists the failures when a metric the collector should
+# have recorded is missing, or has the wrong type or name.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest import FIXTURE, StubPage, start_stub
+
+
+async def one_tick(server, registry, timeout):
+    task = asyncio.ensure_future(server.run_collector())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while registry.get("gcpms_tick_seconds")[0] < 1:
+        if task.done() or loop.time() > deadline:
+            break
+        await asyncio.sleep(0.05)
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def check(registry, storage):
+    failures = []
+
+    def expect(ok, text):
+        if not ok:
+            failures.append(text)
+
+    metrics = registry.metrics
+    expect(registry.get("gcpms_tick_seconds")[0] == 1, "gcpms_tick_seconds: not exactly one tick")
+    expect(registry.get("gcpms_write_row_seconds")[0] == 1, "gcpms_write_row_seconds: no write timed")
+    expect(sum(state[2] for state in metrics["gcpms_fetch_seconds"].values.values()) >= 1,
+           "gcpms_fetch_seconds: no fetch timed")
+    expect(registry.get("gcpms_tick_errors_total") == 0, "gcpms_tick_errors_total: tick failed")
+
+    for name in ("gcpms_tick_overruns_total", "gcpms_ticks_skipped_total"):
+        expect(name in metrics and metrics[name].kind == "counter", f"{name}: not a counter")
+    for name, metric in metrics.items():
+        expect(metric.kind != "counter" or name.endswith("_total"), f"{name}: counter without _total")
+
+    # The writer flushes on close, so the row is on disk once stopped
+    written = sum(metrics["gcpms_rows_written_total"].values.values())
+    expect(written >= 1, f"gcpms_rows_written_total: {written} rows after close ({storage})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check collector metrics after one tick")
+    parser.add_argument("--storage", default="csv", choices=["csv", "binary", "block", "segments"])
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        stub = start_stub(StubPage(f.read()), 0, 0, 0)
+
+    # server.py reads its settings at import and works in the current directory
+    os.environ.update(
+        GCPMS_URL=f"http://127.0.0.1:{stub.server_port}/",
+        GCPMS_TICK_INTERVAL="1",
+        GCPMS_WORKERS=str(args.workers),
+        GCPMS_API_PORT="0",
+        GCPMS_METRICS_PORT="0",
+    )
+    with tempfile.TemporaryDirectory(prefix="gcpms-metrics-") as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import server
+            from metrics import REGISTRY
+
+            server.logger.setLevel("WARNING")
+            server.STORAGE = args.storage
+            asyncio.run(one_tick(server, REGISTRY, args.timeout))
+            failures = check(REGISTRY, args.storage)
+        finally:
+            os.chdir(cwd)
+            stub.shutdown()
+
+    if failures:
+        print("FAIL\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"ok: one {args.storage} tick, "
+          f"write {REGISTRY.get('gcpms_write_row_seconds')[1] * 1000:.2f} ms, "
+          f"tick {REGISTRY.get('gcpms_tick_seconds')[1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import tempfile
+
+# Rollup restart check: writes ticks the way the collector does, stops in
+# the middle of open buckets, restarts later (next hour, next day) and
+# verifies every bucket that has passed is in its Prices_<res>.csv exactly
+# once:
+#
+#   python benchmarks/rollup_check.py
+#
+# Exits non-zero and lists the failures otherwise.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from instruments import SCHEMA_TAG, int_to_time, time_to_int
+from rollups import RESOLUTIONS, Rollup, rollup_path
+from writer import PriceWriter
+
+SCENARIOS = {
+    # name: [(first tick, last tick), ...], one run of the collector each
+    "hour": [("2025-01-01 10:00:00", "2025-01-01 10:58:00"),
+             ("2025-01-01 11:30:00", "2025-01-01 11:40:00")],
+    "day": [("2025-01-01 23:00:00", "2025-01-01 23:58:00"),
+            ("2025-01-02 00:30:00", "2025-01-02 00:40:00")],
+    "days": [("2025-01-01 23:50:00", "2025-01-01 23:58:00"),
+             ("2025-01-03 12:00:00", "2025-01-03 12:05:00")],
+}
+STEP = 60
+
+
+def run_collector(server, first, last):
+    # What run_collector does with rollups, minus the fetching
+    ids = server.ITEM_IDS
+    writer = PriceWriter(server.FILE_NAME, 1, 0, "none")
+    rollup = Rollup(server.FILE_NAME, ids, server.encrypt_data, "none")
+    rollup.replay(server.read_rows(since=rollup.replay_since()))
+
+    ticks = []
+    for t in range(time_to_int(first), time_to_int(last) + 1, STEP):
+        text = int_to_time(t)
+        prices = {item_id: 1000 + t // STEP % 97 + n for n, item_id in enumerate(ids)}
+        writer.write_row([text, server.encrypt_data(server.format_row(prices, ids))])
+        rollup.update(text, prices)
+        ticks.append(t)
+
+    writer.close()
+    rollup.close()
+    return ticks
+
+
+def written_buckets(path):
+    with open(path, "r", encoding="utf-8") as f:
+        times = [line.split(",", 1)[0] for line in f if line.strip()]
+    return [time_to_int(t) for t in times if t != SCHEMA_TAG]
+
+
+def check(server, name, runs):
+    ticks = []
+    for first, last in runs:
+        ticks += run_collector(server, first, last)
+
+    failures = []
+    for resolution, width in RESOLUTIONS.items():
+        # Every bucket with a tick, except the one still open at the end
+        expected = sorted({t - t % width for t in ticks} - {ticks[-1] - ticks[-1] % width})
+        got = written_buckets(rollup_path(server.FILE_NAME, resolution))
+        if got != expected:
+            missing = [int_to_time(t) for t in expected if t not in got]
+            extra = [int_to_time(t) for t in got if t not in expected or got.count(t) > 1]
+            failures.append(f"{name} {resolution}: missing {missing[:3]} extra {extra[:3]}")
+    return failures
+
+
+def main():
+    failures = []
+    # server.py works in the current directory
+    with tempfile.TemporaryDirectory(prefix="gcpms-rollup-") as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import server
+
+            server.logger.setLevel("WARNING")
+            for name, runs in SCENARIOS.items():
+                os.makedirs(name)
+                os.chdir(name)
+                failures += check(server, name, runs)
+                os.chdir(tmp)
+        finally:
+            os.chdir(cwd)
+
+    if failures:
+        print("FAIL\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"ok: {', '.join(SCENARIOS)} restarts, {', '.join(RESOLUTIONS)} rollups complete")
+
+
+if __name__ == "__main__":
+    main()
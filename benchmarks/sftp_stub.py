@@ -0,0 +1,228 @@
+import argparse
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import paramiko
+
+# Local SSH/SFTP stand-in for the collector host, and a sync benchmark
+# against it: new connection per sync vs the pooled backend connection.
+#
+#   python benchmarks/sftp_stub.py --rows 100000 --syncs 20 --append 60
+#   python benchmarks/sftp_stub.py --serve /path/to/root --port 2222
+#
+# Remote absolute paths such as /home/debian/Prices.csv are served from
+# <root>/home/debian/Prices.csv. Any username is accepted with the
+# password "stub". --drop closes every connection after each sync, so the
+# pooled run also exercises the reconnect path.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "stub"
+
+
+# ===================== STUB SERVER =====================
+
+
+class StubAuth(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        if password == PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class StubHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class StubSFTP(paramiko.SFTPServerInterface):
+    # Read-only view of the root directory
+    root = None
+
+    def local(self, path):
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            f = open(self.local(path), "rb")
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = StubHandle(flags)
+        handle.filename = self.local(path)
+        handle.readfile = f
+        return handle
+
+    def list_folder(self, path):
+        try:
+            names = os.listdir(self.local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        out = []
+        for name in names:
+            attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(self.local(path), name)))
+            attr.filename = name
+            out.append(attr)
+        return out
+
+
+class StubServer:
+    def __init__(self, root, host="127.0.0.1", port=0):
+        StubSFTP.root = root
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(16)
+        self.host, self.port = self.sock.getsockname()
+        self.transports = []
+        self.handshakes = 0
+        self.running = True
+
+    def serve_forever(self):
+        while self.running:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, StubSFTP)
+            transport.start_server(server=StubAuth())
+            self.transports.append(transport)
+            self.handshakes += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def drop_all(self):
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def stop(self):
+        self.running = False
+        self.drop_all()
+        self.sock.close()
+
+
+# ===================== SYNC BENCHMARK =====================
+
+
+def append_rows(server, path, start, rows):
+    from bench_suite import START_TIME, STEP
+    from instruments import int_to_time
+
+    ids = server.ITEM_IDS
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        for n in range(start, start + rows):
+            raw = ",".join(str(100_000 + n + i) for i in range(len(ids)))
+            f.write(f"{int_to_time(START_TIME + n * STEP)},{server.encrypt_data(raw)}\n")
+
+
+def run_syncs(backend, server, stub, remote_csv, args, pooled):
+    from bench_suite import make_prices_csv
+
+    make_prices_csv(server, remote_csv, args.rows)
+    for name in ("Prices.csv", backend.SYNC_STATE):
+        if os.path.exists(name):
+            os.remove(name)
+    backend.close_connections()
+
+    enter = f"{stub.host},{stub.port},debian,{PASSWORD}"
+    key_hex, iv_hex = server.key.hex(), server.iv.hex()
+    handshakes = stub.handshakes
+    times, rows = [], args.rows
+
+    for n in range(args.syncs):
+        start = time.perf_counter()
+        result = backend.download_via_sftp(enter, key_hex, iv_hex)
+        times.append(time.perf_counter() - start)
+        if result != (True, 1):
+            raise RuntimeError(f"sync {n} failed: {result}")
+
+        if not pooled:
+            backend.close_connections()
+        if args.drop:
+            stub.drop_all()
+        append_rows(server, remote_csv, rows, args.append)
+        rows += args.append
+
+    backend.close_connections()
+    with open(remote_csv, "rb") as remote, open("Prices.csv", "rb") as local:
+        same = remote.read().startswith(local.read())
+
+    label = "pooled" if pooled else "new connection"
+    steady = sorted(times[1:]) or times
+    print(
+        f"  {label:<16} first {times[0] * 1000:8.1f} ms   "
+        f"median {steady[len(steady) // 2] * 1000:8.1f} ms   "
+        f"handshakes {stub.handshakes - handshakes:3}   prefix ok {same}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SFTP stand-in and sync benchmark")
+    parser.add_argument("--serve", metavar="ROOT", help="only serve ROOT until interrupted")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--rows", type=int, default=20000, help="rows in the remote Prices.csv")
+    parser.add_argument("--syncs", type=int, default=10)
+    parser.add_argument("--append", type=int, default=60, help="rows appended between syncs")
+    parser.add_argument("--drop", action="store_true", help="drop connections after every sync")
+    args = parser.parse_args()
+
+    if args.serve:
+        stub = StubServer(os.path.abspath(args.serve), port=args.port)
+        print(f"serving {args.serve} on {stub.host}:{stub.port} (password {PASSWORD!r})")
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            stub.stop()
+        return
+
+    # server.py and backend.py work in the current directory
+    with tempfile.TemporaryDirectory(prefix="gcpms-sftp-") as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import server
+            import backend
+
+            server.logger.setLevel("WARNING")
+            logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+            remote_csv = os.path.join(tmp, "remote") + backend.REMOTE_PRICES
+            os.makedirs(os.path.dirname(remote_csv))
+            stub = StubServer(os.path.join(tmp, "remote"), port=args.port).start()
+
+            print(f"{args.syncs} syncs of {args.rows:,} rows + {args.append} per sync")
+            run_syncs(backend, server, stub, remote_csv, args, pooled=False)
+            run_syncs(backend, server, stub, remote_csv, args, pooled=True)
+            stub.stop()
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
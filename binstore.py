@@ -0,0 +1,240 @@
+import argparse
+import base64
+import csv
+import json
+import mmap
+import os
+import struct
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+from instruments import (
+    LEGACY_COLUMNS,
+    SCHEMA_TAG,
+    decode_schema,
+    encode_schema,
+    int_to_time,
+    is_run_line,
+    run_times,
+    time_to_int,
+)
+from writer import PriceWriter
+
+# ===================== FORMAT =====================
+
+# Optional append-only alternative to Prices.csv. Unencrypted, so keep it on
+# trusted hosts only.
+#
+#   header  : magic "GCPMSBIN", u16 version, u16 column count, u32 data offset,
+#             then the column ids joined by "\n", zero padded to 8 bytes
+#   records : int64 timestamp + one int64 per column, little endian
+#
+# Timestamps are Tehran wall-clock seconds counted as if UTC, the same clock
+# as the Time column of Prices.csv. Missing prices are stored as MISSING.
+
+MAGIC = b"GCPMSBIN"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+MISSING = -(2**63)
+
+BIN_FILE = "Prices.bin"
+
+
+def record_struct(column_count):
+    return struct.Struct(f"<{column_count + 1}q")
+
+
+def write_header(f, ids):
+    names = "\n".join(ids).encode("utf-8")
+    offset = HEADER.size + len(names)
+    offset += -offset % 8
+    f.write(HEADER.pack(MAGIC, VERSION, len(ids), offset))
+    f.write(names.ljust(offset - HEADER.size, b"\0"))
+
+
+def read_header(f):
+    magic, version, column_count, offset = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a GCPMS binary price file")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary store version {version}")
+
+    names = f.read(offset - HEADER.size).rstrip(b"\0").decode("utf-8")
+    ids = names.split("\n") if names else []
+    if len(ids) != column_count:
+        raise ValueError("Corrupt binary store header")
+    return ids, offset
+
+
+def is_binary_store(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def pack_record(packer, timestamp, values):
+    if isinstance(timestamp, str):
+        timestamp = time_to_int(timestamp)
+    return packer.pack(
+        timestamp, *(MISSING if v is None else v for v in values)
+    )
+
+
+# ===================== READ =====================
+
+
+def read_columns(path):
+    # Zero-copy view of the whole file: returns (ids, times, {id: prices}),
+    # each a strided int64 memoryview over one mmap
+    with open(path, "rb") as f:
+        ids, offset = read_header(f)
+        size = os.fstat(f.fileno()).st_size
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    width = len(ids) + 1
+    count = (size - offset) // (8 * width)  # ignores a torn last record
+    flat = memoryview(mm)[offset : offset + count * width * 8].cast("q")
+
+    times = flat[0::width]
+    columns = {item_id: flat[k + 1 :: width] for k, item_id in enumerate(ids)}
+    return ids, times, columns
+
+
+# ===================== WRITE =====================
+
+
+class BinaryWriter(PriceWriter):
+    # Same batching and fsync policy as PriceWriter; rows are
+    # [timestamp, [price or None per column]]
+
+    def __init__(self, file_path, ids, *args, **kwargs):
+        super().__init__(file_path, *args, **kwargs)
+        self.ids = list(ids)
+        self.packer = record_struct(len(self.ids))
+
+    def open(self):
+        if self.file is not None:
+            return self
+
+        if os.path.isfile(self.file_path) and os.path.getsize(self.file_path) > 0:
+            with open(self.file_path, "rb") as f:
+                ids, offset = read_header(f)
+            if ids != self.ids:
+                raise ValueError(
+                    f"{self.file_path} columns differ from the registry; convert it first"
+                )
+
+            # Drop a torn trailing record so appends stay aligned
+            size = os.path.getsize(self.file_path)
+            extra = (size - offset) % self.packer.size
+            self.file = open(self.file_path, "r+b")
+            if extra:
+                self.file.truncate(size - extra)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(self.file_path, "wb")
+            write_header(self.file, self.ids)
+            self.file.flush()  # readers of the empty store need the header
+
+        return self
+
+    def write_rows(self, rows):
+        self.file.write(
+            b"".join(pack_record(self.packer, t, values) for t, values in rows)
+        )
+
+
+# ===================== CONVERT =====================
+
+
+def make_cipher_funcs(key_hex, iv_hex):
+    key, iv = bytes.fromhex(key_hex), bytes.fromhex(iv_hex)
+
+    def encrypt(text):
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+        return base64.b64encode(cipher.encrypt(pad(text.encode(), AES.block_size))).decode()
+
+    def decrypt(text):
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+        return unpad(cipher.decrypt(base64.b64decode(text)), AES.block_size).decode()
+
+    return encrypt, decrypt
+
+
+def csv_to_bin(csv_path, bin_path, decrypt):
+    # First pass: every column that appears in any schema, in first-seen order
+    ids = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        has_legacy_rows = False
+        for line in f:
+            fields = line.strip().split(",")
+            if fields[0] == SCHEMA_TAG:
+                ids += [i for i in decode_schema(decrypt(fields[1])) if i not in ids]
+            elif len(fields) > 1 and not ids and not is_run_line(fields):
+                has_legacy_rows = True
+        if has_legacy_rows:
+            ids = LEGACY_COLUMNS + [i for i in ids if i not in LEGACY_COLUMNS]
+
+    packer = record_struct(len(ids))
+    columns = LEGACY_COLUMNS
+    row, last_time = None, None
+    count = 0
+
+    with open(csv_path, "r", encoding="utf-8") as src, open(bin_path, "wb") as dst:
+        write_header(dst, ids)
+        for line in src:
+            fields = line.strip().split(",")
+            if len(fields) < 2:
+                continue
+            if fields[0] == SCHEMA_TAG:
+                columns = decode_schema(decrypt(fields[1]))
+                continue
+
+            if is_run_line(fields):
+                times = run_times(last_time, fields)
+            else:
+                values = dict(zip(columns, decrypt(fields[1]).split(",")))
+                row = [int(values[i]) if values.get(i) else None for i in ids]
+                times = [fields[0]]
+
+            for t in times:
+                dst.write(pack_record(packer, t, row))
+                count += 1
+            last_time = fields[0]
+
+    return count
+
+
+def bin_to_csv(bin_path, csv_path, encrypt):
+    ids, times, columns = read_columns(bin_path)
+    cols = [columns[i] for i in ids]
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f)
+        out.writerow([SCHEMA_TAG, encrypt(encode_schema(ids))])
+        for n, t in enumerate(times):
+            values = ("" if c[n] == MISSING else str(c[n]) for c in cols)
+            out.writerow([int_to_time(t), encrypt(",".join(values))])
+
+    return len(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between Prices.csv and Prices.bin")
+    parser.add_argument("direction", choices=["to-bin", "to-csv"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--config", default="config.json", help="AES key/iv file")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    encrypt, decrypt = make_cipher_funcs(cfg["key"], cfg["iv"])
+
+    if args.direction == "to-bin":
+        rows = csv_to_bin(args.source, args.target, decrypt)
+    else:
+        rows = bin_to_csv(args.source, args.target, encrypt)
+    print(f"{rows} rows written to {args.target}")
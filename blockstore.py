@@ -0,0 +1,360 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import struct
+
+from Crypto.Cipher import AES
+
+from binstore import make_cipher_funcs
+from instruments import (
+    LEGACY_COLUMNS,
+    SCHEMA_TAG,
+    decode_schema,
+    encode_schema,
+    is_run_line,
+    run_times,
+)
+from writer import PriceWriter
+
+# ===================== FORMAT =====================
+
+# Encrypted container holding many rows per AES-GCM block.
+#
+#   file header  : magic "GCPMSGCM", u16 version, 6 pad bytes
+#   block        : 12-byte random nonce, u32 ciphertext length,
+#                  ciphertext, 16-byte GCM tag
+#
+# A block decrypts to UTF-8 lines: "#schema,<ids>" first, then
+# "<time>,<v1>,<v2>,..." rows, so every block can be read on its own.
+# The block index is authenticated too, so blocks cannot be reordered
+# or dropped from the middle without the tag check failing.
+
+MAGIC = b"GCPMSGCM"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sH6x")
+BLOCK_HEADER = struct.Struct("<12sI")
+TAG_SIZE = 16
+
+BLOCK_FILE = "Prices.gcm"
+
+
+JOURNAL_SUFFIX = ".journal"
+
+
+def block_key(key: bytes) -> bytes:
+    # Separate subkey so the GCM container never shares a key with the CBC rows
+    return hmac.new(key, b"gcpms-block-v1", hashlib.sha256).digest()
+
+
+def journal_key(key: bytes) -> bytes:
+    # And another one so a journal entry can never pass for a block
+    return hmac.new(key, b"gcpms-journal-v1", hashlib.sha256).digest()
+
+
+def block_aad(index):
+    return MAGIC + struct.pack("<Q", index)
+
+
+def is_block_store(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encrypt_block(gcm_key, index, text):
+    nonce = secrets.token_bytes(12)
+    cipher = AES.new(gcm_key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(block_aad(index))
+    ciphertext, tag = cipher.encrypt_and_digest(text.encode("utf-8"))
+    return BLOCK_HEADER.pack(nonce, len(ciphertext)) + ciphertext + tag
+
+
+def decrypt_block(gcm_key, index, nonce, ciphertext, tag):
+    cipher = AES.new(gcm_key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(block_aad(index))
+    try:
+        return cipher.decrypt_and_verify(ciphertext, tag).decode("utf-8")
+    except ValueError:
+        raise ValueError(f"Block {index} failed authentication (wrong key or tampered)")
+
+
+# ===================== READ =====================
+
+
+def read_file_header(f):
+    magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a GCPMS block file")
+    if version != VERSION:
+        raise ValueError(f"Unsupported block file version {version}")
+
+
+def iter_raw_blocks(f):
+    # Yields (index, offset, nonce, ciphertext, tag); stops at a torn block
+    index = 0
+    while True:
+        offset = f.tell()
+        head = f.read(BLOCK_HEADER.size)
+        if len(head) < BLOCK_HEADER.size:
+            return
+
+        nonce, length = BLOCK_HEADER.unpack(head)
+        body = f.read(length + TAG_SIZE)
+        if len(body) < length + TAG_SIZE:
+            return
+
+        yield index, offset, nonce, body[:length], body[length:]
+        index += 1
+
+
+def iter_blocks(path, key: bytes):
+    gcm_key = block_key(key)
+    with open(path, "rb") as f:
+        read_file_header(f)
+        for index, _, nonce, ciphertext, tag in iter_raw_blocks(f):
+            yield decrypt_block(gcm_key, index, nonce, ciphertext, tag)
+
+
+def iter_rows(path, key: bytes):
+    # Yields (time, {id: price text}) for every row of every block
+    for text in iter_blocks(path, key):
+        columns = []
+        for line in text.splitlines():
+            fields = line.split(",")
+            if fields[0] == SCHEMA_TAG:
+                columns = fields[1:]
+            else:
+                yield fields[0], dict(zip(columns, fields[1:]))
+
+
+# ===================== WRITE =====================
+
+
+class BlockWriter(PriceWriter):
+    # Every flush becomes one GCM block; rows are [time, "v1,v2,..."]
+    #
+    # Rows waiting for the next block are also appended, one GCM block each,
+    # to <file>.journal (same layout, own subkey), which is emptied once the
+    # block holding them is written. After a crash open() puts the journal
+    # rows back in the buffer, so a long flush interval loses nothing to a
+    # process crash. The journal follows the fsync policy: "row" syncs every
+    # entry, "batch" syncs at each flush, so a power loss can still take the
+    # rows since the last flush, as in the other storage modes.
+
+    def __init__(self, file_path, ids, key: bytes, *args, journal=True, **kwargs):
+        super().__init__(file_path, *args, **kwargs)
+        self.ids = list(ids)
+        self.gcm_key = block_key(key)
+        self.index = 0
+
+        self.journal_path = file_path + JOURNAL_SUFFIX if journal else None
+        self.journal_key = journal_key(key)
+        self.journal = None
+        self.journal_index = 0
+
+    def open(self):
+        if self.file is not None:
+            return self
+
+        if os.path.isfile(self.file_path) and os.path.getsize(self.file_path) > 0:
+            end = FILE_HEADER.size
+            with open(self.file_path, "rb") as f:
+                read_file_header(f)
+                for index, *_ in iter_raw_blocks(f):
+                    self.index = index + 1
+                    end = f.tell()
+
+            # Drop a torn trailing block so the next one starts cleanly
+            self.file = open(self.file_path, "r+b")
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(self.file_path, "wb")
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.file.flush()
+
+        if self.journal_path and self.journal is None:
+            self.open_journal()
+        return self
+
+    # -------- journal --------
+
+    def open_journal(self):
+        end = FILE_HEADER.size
+        rows = []
+        if os.path.isfile(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            try:
+                with open(self.journal_path, "rb") as f:
+                    read_file_header(f)
+                    for index, _, nonce, ciphertext, tag in iter_raw_blocks(f):
+                        text = decrypt_block(self.journal_key, index, nonce, ciphertext, tag)
+                        rows.append(self.journal_row(text))
+                        self.journal_index = index + 1
+                        end = f.tell()
+            except ValueError as e:
+                # Not under this key (or damaged): keep it for inspection
+                os.replace(self.journal_path, self.journal_path + ".bad")
+                rows, end, self.journal_index = [], FILE_HEADER.size, 0
+                if self.logger:
+                    self.logger.error(f"{self.journal_path} unreadable ({e}), moved aside")
+
+        if os.path.isfile(self.journal_path):
+            # Drop a torn trailing entry
+            self.journal = open(self.journal_path, "r+b")
+            self.journal.truncate(end)
+            self.journal.seek(end)
+        else:
+            self.journal = open(self.journal_path, "wb")
+            self.journal.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.journal.flush()
+
+        if rows:
+            self.buffer[:0] = rows
+            if self.logger:
+                self.logger.info(f"Recovered {len(rows)} unsealed rows from {self.journal_path}")
+
+    def journal_row(self, text):
+        # "#schema,<ids>\n<time>,<values>" -> row in the current column order
+        schema, line = text.split("\n", 1)
+        ids = decode_schema(schema.split(",", 1)[1])
+        t, _, values = line.partition(",")
+        if ids != self.ids:
+            by_id = dict(zip(ids, values.split(",")))
+            values = ",".join(by_id.get(item_id, "") for item_id in self.ids)
+        return [t, values]
+
+    def log_row(self, row):
+        text = f"{SCHEMA_TAG},{encode_schema(self.ids)}\n{row[0]},{row[1]}"
+        self.journal.write(encrypt_block(self.journal_key, self.journal_index, text))
+        self.journal.flush()
+        if self.fsync == "row":
+            os.fsync(self.journal.fileno())
+        self.journal_index += 1
+
+    def clear_journal(self):
+        self.journal.truncate(FILE_HEADER.size)
+        self.journal.seek(FILE_HEADER.size)
+        self.journal_index = 0
+
+    # -------- writer --------
+
+    def write_row(self, row):
+        if self.journal_path:
+            self.open()
+            self.log_row(row)
+        super().write_row(row)
+
+    def write_rows(self, rows):
+        lines = [f"{SCHEMA_TAG},{encode_schema(self.ids)}"]
+        lines += [f"{t},{values}" for t, values in rows]
+        self.file.write(encrypt_block(self.gcm_key, self.index, "\n".join(lines)))
+        self.index += 1
+
+    def flush(self):
+        super().flush()
+        if self.journal is None or not self.journal_index:
+            return
+        # The rows are in a block on disk once the buffer is empty; if the
+        # block write failed they stay journaled
+        if not self.buffer:
+            self.clear_journal()
+        if self.fsync != "none":
+            os.fsync(self.journal.fileno())
+
+    def close(self):
+        # A failed flush closes only the block file; the journal stays open
+        # until here so its rows are not recovered a second time
+        try:
+            super().close()
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+
+# ===================== MIGRATE =====================
+
+
+def csv_to_blocks(csv_path, block_path, key: bytes, iv: bytes, rows_per_block=1000):
+    # Re-packs per-row AES-CBC Prices.csv into GCM blocks, schema changes
+    # start a new block
+    _, decrypt = make_cipher_funcs(key.hex(), iv.hex())
+    columns = LEGACY_COLUMNS
+    values, last_time = None, None
+    count = 0
+
+    writer = BlockWriter(
+        block_path, columns, key, rows_per_block, float("inf"), "batch", journal=False
+    )
+    if os.path.isfile(block_path):
+        os.remove(block_path)
+
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.strip().split(",")
+            if len(fields) < 2:
+                continue
+
+            if fields[0] == SCHEMA_TAG:
+                writer.flush()
+                columns = decode_schema(decrypt(fields[1]))
+                writer.ids = columns
+                continue
+
+            if is_run_line(fields):
+                times = run_times(last_time, fields)
+            else:
+                values = decrypt(fields[1])
+                times = [fields[0]]
+
+            for t in times:
+                writer.write_row([t, values])
+                count += 1
+            last_time = fields[0]
+
+    writer.close()
+    return count
+
+
+def blocks_to_csv(block_path, csv_path, key: bytes, iv: bytes):
+    encrypt, _ = make_cipher_funcs(key.hex(), iv.hex())
+    schema = None
+    count = 0
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as out:
+        for text in iter_blocks(block_path, key):
+            for line in text.splitlines():
+                t, _, values = line.partition(",")
+                if t == SCHEMA_TAG:
+                    if values != schema:
+                        out.write(f"{SCHEMA_TAG},{encrypt(values)}\r\n")
+                        schema = values
+                else:
+                    out.write(f"{t},{encrypt(values)}\r\n")
+                    count += 1
+
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between Prices.csv and Prices.gcm")
+    parser.add_argument("direction", choices=["to-blocks", "to-csv"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per block")
+    parser.add_argument("--config", default="config.json", help="AES key/iv file")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    key, iv = bytes.fromhex(cfg["key"]), bytes.fromhex(cfg["iv"])
+
+    if args.direction == "to-blocks":
+        rows = csv_to_blocks(args.source, args.target, key, iv, args.rows)
+    else:
+        rows = blocks_to_csv(args.source, args.target, key, iv)
+    print(f"{rows} rows written to {args.target}")
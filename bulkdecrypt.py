@@ -0,0 +1,245 @@
+import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from Crypto.Cipher import AES
+
+from instruments import (
+    LEGACY_COLUMNS,
+    RUN_TAG,
+    SCHEMA_TAG,
+    decode_schema,
+    run_times,
+)
+
+# ===================== BULK DECRYPT =====================
+
+# Decodes Prices.csv lines a chunk at a time into columns:
+#
+#   {"Time": [t, ...], "<id>": [price or None, ...], ...}
+#
+# Every row is AES-CBC under the same key and IV, so the ciphertexts of a
+# whole chunk are joined and decrypted with ONE cipher call: CBC chains each
+# block to the block before it, which is right inside a row and wrong only
+# for the first block of each row, where the previous row's last block is
+# XORed in instead of the IV. That is undone per row on 16 bytes.
+#
+# decode_lines() splits a file into chunks and hands them to a process pool
+# when there are at least PARALLEL_MIN_LINES; the state a chunk needs from
+# the lines before it (schema, last row, last time) comes from a scan that
+# only decrypts schema lines. Rows that do not decrypt (torn last line) are
+# skipped.
+
+CHUNK_LINES = 20000
+PARALLEL_MIN_LINES = 50000
+
+BLOCK = AES.block_size
+
+
+def new_state():
+    # Where a chunk starts: the columns of the last schema line, the
+    # ciphertext of the last full row and the time of the last line
+    return {"columns": LEGACY_COLUMNS, "encrypted": None, "last_time": None}
+
+
+def decrypt_many(texts, key, iv):
+    # Base64 ciphertexts -> plaintexts (None where a row does not decrypt)
+    raw, good = [], []
+    for n, text in enumerate(texts):
+        try:
+            data = base64.b64decode(text)
+        except ValueError:
+            continue
+        if data and len(data) % BLOCK == 0:
+            raw.append(data)
+            good.append(n)
+
+    out = [None] * len(texts)
+    if not raw:
+        return out
+
+    plain = AES.new(key, AES.MODE_CBC, iv).decrypt(b"".join(raw))
+    iv_int = int.from_bytes(iv, "big")
+    pos, previous = 0, None
+
+    for n, data in zip(good, raw):
+        row = plain[pos:pos + len(data)]
+        if previous is not None:
+            # First block was chained to the previous row instead of the IV
+            fix = int.from_bytes(previous[-BLOCK:], "big") ^ iv_int
+            head = int.from_bytes(row[:BLOCK], "big") ^ fix
+            row = head.to_bytes(BLOCK, "big") + row[BLOCK:]
+        pos += len(data)
+        previous = data
+
+        pad = row[-1]
+        if not 1 <= pad <= BLOCK or row[-pad:] != bytes([pad]) * pad:
+            continue
+        try:
+            out[n] = row[:-pad].decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+
+    return out
+
+
+def in_span(t, since=None, until=None):
+    return (since is None or t >= since) and (until is None or t < until)
+
+
+def to_price(text):
+    return int(text) if text else None
+
+
+# ===================== CHUNKS =====================
+
+
+def decode_chunk(lines, key_hex, iv_hex, ids, state, since=None, until=None):
+    # One chunk of lines -> columns for ids, in file order. Rows only needed
+    # outside [since, until) are not decrypted.
+    key, iv = bytes.fromhex(key_hex), bytes.fromhex(iv_hex)
+    columns, last_time = state["columns"], state["last_time"]
+
+    # First pass: parse, expand runs and mark the rows that must be decrypted
+    entries = []  # (columns, cipher index, times)
+    ciphers, needed = [], set()
+    if state["encrypted"] is not None:
+        ciphers.append(state["encrypted"])
+    current = 0 if ciphers else None
+
+    for line in lines:
+        fields = line.strip().split(",")
+        if len(fields) < 2:
+            continue
+
+        if fields[0] == SCHEMA_TAG:
+            plain = decrypt_many([fields[1]], key, iv)[0]
+            columns = decode_schema(plain) if plain else columns
+            continue
+
+        if fields[1].startswith(RUN_TAG):
+            if current is None or last_time is None:
+                last_time = fields[0]
+                continue
+            times = run_times(last_time, fields)
+        else:
+            ciphers.append(fields[1])
+            current = len(ciphers) - 1
+            times = [fields[0]]
+        last_time = fields[0]
+
+        times = [t for t in times if in_span(t, since, until)]
+        if times:
+            entries.append((columns, current, times))
+            needed.add(current)
+
+    # One batched decrypt for the whole chunk
+    wanted = sorted(needed)
+    plains = dict(zip(wanted, decrypt_many([ciphers[n] for n in wanted], key, iv)))
+
+    out = {"Time": []}
+    for item_id in ids:
+        out[item_id] = []
+    positions_cache, prices_cache = {}, {}
+
+    for row_columns, index, times in entries:
+        plain = plains.get(index)
+        if plain is None:
+            continue
+
+        prices = prices_cache.get(index)
+        if prices is None:
+            positions = positions_cache.get(id(row_columns))
+            if positions is None:
+                where = {item_id: n for n, item_id in enumerate(row_columns)}
+                positions = positions_cache[id(row_columns)] = [where.get(item_id) for item_id in ids]
+            values = plain.split(",")
+            prices = prices_cache[index] = [
+                to_price(values[n]) if n is not None and n < len(values) else None
+                for n in positions
+            ]
+
+        for t in times:
+            out["Time"].append(t)
+            for item_id, price in zip(ids, prices):
+                out[item_id].append(price)
+
+    end_state = {
+        "columns": columns,
+        "encrypted": ciphers[current] if current is not None else None,
+        "last_time": last_time,
+    }
+    return out, end_state
+
+
+def split_chunks(lines, key_hex, iv_hex, state, chunk_lines=CHUNK_LINES):
+    # Yields (lines, state at the first line) without decrypting rows
+    key, iv = bytes.fromhex(key_hex), bytes.fromhex(iv_hex)
+    state = dict(state)
+
+    for start in range(0, len(lines), chunk_lines):
+        chunk = lines[start:start + chunk_lines]
+        yield chunk, dict(state)
+
+        for line in chunk:
+            head, sep, rest = line.strip().partition(",")
+            if not sep or not rest:
+                continue
+            if head == SCHEMA_TAG:
+                plain = decrypt_many([rest], key, iv)[0]
+                if plain:
+                    state["columns"] = decode_schema(plain)
+                continue
+            if not rest.startswith(RUN_TAG):
+                state["encrypted"] = rest
+            state["last_time"] = head
+
+
+# ===================== POOL =====================
+
+_pool = None
+
+
+def get_pool(workers=None):
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(workers or os.cpu_count() or 1)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def decode_lines(lines, key_hex, iv_hex, ids, state=None, since=None, until=None,
+                 workers=None, chunk_lines=CHUNK_LINES):
+    # Whole file or chunk -> (columns, state after the last line)
+    state = state or new_state()
+    workers = workers if workers is not None else os.cpu_count() or 1
+
+    if workers < 2 or len(lines) < PARALLEL_MIN_LINES:
+        return decode_chunk(lines, key_hex, iv_hex, ids, state, since, until)
+
+    pool = get_pool(workers)
+    futures = [
+        pool.submit(decode_chunk, chunk, key_hex, iv_hex, ids, chunk_state, since, until)
+        for chunk, chunk_state in split_chunks(lines, key_hex, iv_hex, state, chunk_lines)
+    ]
+
+    out = {"Time": []}
+    for item_id in ids:
+        out[item_id] = []
+    for future in futures:
+        part, state = future.result()
+        for name, values in part.items():
+            out[name].extend(values)
+    return out, state
+
+
+def decode_file(path, key_hex, iv_hex, ids, since=None, until=None, workers=None):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    return decode_lines(lines, key_hex, iv_hex, ids, None, since, until, workers)[0]
@@ -0,0 +1,103 @@
+import re
+
+from bs4 import BeautifulSoup
+
+# ===================== FAST PATH =====================
+
+# tgju renders every instrument as <li id="..."> ... <span class="info-price">1,234</span>
+LI_RE = re.compile(r"<li\b[^>]*?\sid=[\"']([^\"']+)[\"']", re.I)
+PRICE_RE = re.compile(
+    r"<span\b[^>]*?\sclass=[\"'](?:[^\"']*\s)?info-price(?:\s[^\"']*)?[\"'][^>]*>([^<]*)<",
+    re.I,
+)
+LI_END = "</li"
+
+
+def to_int(price_text):
+    return int(price_text.strip().replace(",", ""))
+
+
+def extract_fast(html, item_ids):
+    # Single scan over the raw text, stops as soon as every id has been seen
+    wanted = set(item_ids)
+    prices = {}
+
+    for match in LI_RE.finditer(html):
+        item_id = match.group(1)
+        if item_id not in wanted or item_id in prices:
+            continue
+
+        end = html.find(LI_END, match.end())
+        if end == -1:
+            end = len(html)
+
+        price = PRICE_RE.search(html, match.end(), end)
+        if price:
+            try:
+                prices[item_id] = to_int(price.group(1))
+            except ValueError:
+                pass
+
+        if len(prices) == len(wanted):
+            break
+
+    return prices
+
+
+# ===================== BEAUTIFULSOUP PATH =====================
+
+
+def extract_bs4(html, item_ids):
+    soup = BeautifulSoup(html, "html.parser")
+    prices = {}
+
+    for item_id in item_ids:
+        item = soup.find("li", id=item_id)
+        if not item:
+            continue
+
+        span = item.find("span", class_="info-price")
+        if not span:
+            continue
+
+        try:
+            prices[item_id] = to_int(span.text)
+        except ValueError:
+            pass
+
+    return prices
+
+
+EXTRACTORS = {
+    "fast": extract_fast,
+    "bs4": extract_bs4,
+}
+
+
+# ===================== PUBLIC API =====================
+
+
+def extract_prices(html, item_ids, mode="fast", logger=None, strict=True, expected=None):
+    # expected: the ids this page should carry (default item_ids). An id the
+    # page never has is not worth a full parse every tick.
+    prices = EXTRACTORS[mode](html, item_ids)
+    expected = item_ids if expected is None else expected
+
+    # An expected id the fast path could not read is retried with the full parser
+    missing = [item_id for item_id in expected if item_id not in prices]
+    if missing and mode != "bs4":
+        if logger:
+            logger.warning(f"{mode} extractor missed {missing}, falling back to bs4")
+        prices.update(extract_bs4(html, missing))
+        missing = [item_id for item_id in expected if item_id not in prices]
+
+    if missing and strict:
+        raise RuntimeError(f"{', '.join(missing)} not found in HTML")
+
+    return prices
+
+
+def verify(html, item_ids):
+    fast = extract_fast(html, item_ids)
+    slow = extract_bs4(html, item_ids)
+    return fast == slow, fast, slow
@@ -0,0 +1,121 @@
+import calendar
+import json
+import os
+import time
+
+# ===================== REGISTRY =====================
+
+# One entry per tracked tgju item, shared by server, backend and GUI.
+# Override with an instruments.json list of the same shape.
+DEFAULT_INSTRUMENTS = [
+    {"name": "Gold", "id": "l-geram18", "color": "#F97316", "icon": "pics/gold.png"},
+    {"name": "Coin", "id": "l-sekee", "color": "#3B82F6", "icon": "pics/coin.png"},
+    {"name": "USD", "id": "l-price_dollar_rl", "color": "#6366F1", "icon": "pics/dollar.png"},
+    {"name": "USDT", "id": "l-crypto-tether-irr", "color": "#22C55E", "icon": "pics/tether.png"},
+]
+
+INSTRUMENTS_FILE = "instruments.json"
+
+DEFAULT_COLOR = "#9CA3AF"
+
+# Column order of rows written before the registry existed (no #schema line)
+LEGACY_COLUMNS = [
+    "l-crypto-tether-irr",
+    "l-price_dollar_rl",
+    "l-geram18",
+    "l-sekee",
+]
+
+SCHEMA_TAG = "#schema"
+
+# "<time>,=<n>": the previous row repeated n more times, evenly spaced up to
+# <time>; written by the change-only mode instead of identical rows
+RUN_TAG = "="
+
+# Timestamps are Tehran wall-clock text; as ints they are counted as if UTC
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def validate(instruments):
+    names, ids = set(), set()
+
+    for item in instruments:
+        if not item.get("name") or not item.get("id"):
+            raise ValueError(f"Instrument needs a name and id: {item}")
+        if item["name"] in names or item["id"] in ids:
+            raise ValueError(f"Duplicate instrument: {item}")
+        if "," in item["id"]:
+            raise ValueError(f"Instrument id cannot contain ',': {item['id']}")
+
+        names.add(item["name"])
+        ids.add(item["id"])
+
+    return instruments
+
+
+def load_instruments(path=INSTRUMENTS_FILE):
+    if not path or not os.path.isfile(path):
+        return DEFAULT_INSTRUMENTS
+
+    with open(path, "r", encoding="utf-8") as f:
+        return validate(json.load(f))
+
+
+def item_ids(instruments):
+    return [item["id"] for item in instruments]
+
+
+def names_by_id(instruments):
+    return {item["id"]: item["name"] for item in instruments}
+
+
+# ===================== ROW SCHEMA =====================
+
+# Prices.csv is self-describing: a "#schema,<encrypted id list>" line sets the
+# column order for every row that follows it, until the next schema line.
+
+
+def encode_schema(ids):
+    return ",".join(ids)
+
+
+def decode_schema(text):
+    return text.split(",") if text else []
+
+
+def is_schema_line(fields):
+    return bool(fields) and fields[0] == SCHEMA_TAG
+
+
+def is_run_line(fields):
+    return len(fields) > 1 and fields[1].startswith(RUN_TAG)
+
+
+def run_times(anchor, fields):
+    # Timestamps a run line stands for, given the time of the line before it
+    count = int(fields[1][len(RUN_TAG):])
+    start, end = time_to_int(anchor), time_to_int(fields[0])
+    step = (end - start) / count
+    return [int_to_time(round(start + step * k)) for k in range(1, count + 1)]
+
+
+# ===================== TIME =====================
+
+
+def time_to_int(text):
+    return calendar.timegm(time.strptime(text, TIME_FORMAT))
+
+
+def int_to_time(value):
+    return time.strftime(TIME_FORMAT, time.gmtime(value))
+
+
+def full_time(text):
+    # A since/until prefix ("2025-12-30", "2025-12-30 14") -> the first full
+    # timestamp it admits, so text and int comparisons select the same rows
+    text = text + "0000-00-00 00:00:00"[len(text):]
+    if text[5:7] == "00":
+        text = text[:5] + "01" + text[7:]
+    if text[8:10] == "00":
+        text = text[:8] + "01" + text[10:]
+    return text
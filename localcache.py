@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from binstore import read_columns, read_header, write_header
+from pricestore import to_prices, to_times
+
+# ===================== DECRYPTED CACHE =====================
+
+# Decoded rows of every CSV source the client has loaded, so a restart maps
+# them back in instead of decrypting the whole history again:
+#
+#   cache/<source name>.bin    Prices.bin format: int64 time + int64 per id
+#   cache/<source name>.json   what the .bin was built from (see below)
+#
+# The .bin holds the rows exactly as bulkdecrypt produced them, in file
+# order; PriceStore.merge sorts and de-duplicates as for a fresh load. The
+# .json records the key/IV hash, the id order, the source's size, mtime and
+# a hash of its first and last CACHE_CHECK_BYTES, how many rows are valid
+# and the loader state at the byte the rows stop (offset, schema, last row).
+#
+# A source that only grew is checked against that hash and its new bytes
+# are decrypted from the recorded offset. A different key, a changed
+# instrument list or a rewritten/shrunk source invalidates the cache.
+#
+# The cache is plaintext prices; it lives next to the data it mirrors and
+# is as private as the machine it is on.
+
+CACHE_DIR = "cache"
+CACHE_CHECK_BYTES = 4096
+
+
+def key_hash(key_hex, iv_hex):
+    # Same value server.py keeps in aes_hash.txt
+    return hashlib.sha256(bytes.fromhex(key_hex) + bytes.fromhex(iv_hex)).hexdigest()
+
+
+def cache_paths(source):
+    base = os.path.join(os.path.dirname(source), CACHE_DIR, os.path.basename(source))
+    return base + ".bin", base + ".json"
+
+
+def source_hash(source, size):
+    # First and last CACHE_CHECK_BYTES of the first size bytes
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        digest.update(f.read(min(CACHE_CHECK_BYTES, size)))
+        tail = min(CACHE_CHECK_BYTES, size)
+        f.seek(size - tail)
+        digest.update(f.read(tail))
+    return digest.hexdigest()
+
+
+def load_meta(source):
+    path = cache_paths(source)[1]
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def save_meta(source, meta):
+    path = cache_paths(source)[1]
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+
+def drop_cache(source):
+    for path in cache_paths(source):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+# ===================== READ =====================
+
+
+def read_cache(source, key_hex, iv_hex, ids):
+    # (times, {id: prices}, loader state) from the cache, or None when it
+    # does not belong to this source, key and id list. times and prices
+    # are int64 arrays over the mmap.
+    meta = load_meta(source)
+    bin_path = cache_paths(source)[0]
+    if meta is None or not os.path.isfile(bin_path) or not os.path.isfile(source):
+        return None
+
+    stat = os.stat(source)
+    if meta["key"] != key_hash(key_hex, iv_hex) or meta["ids"] != list(ids):
+        return None
+    if stat.st_size < meta["size"]:
+        return None
+    if stat.st_size == meta["size"] and stat.st_mtime_ns == meta["mtime_ns"]:
+        pass  # untouched since the cache was written
+    elif source.endswith(".gz") or source_hash(source, meta["size"]) != meta["hash"]:
+        return None  # closed segments never grow; anything else was rewritten
+
+    cached_ids, times, columns = read_columns(bin_path)
+    if cached_ids != list(ids) or len(times) < meta["rows"]:
+        return None
+
+    rows = meta["rows"]
+    times = np.asarray(times)[:rows]
+    columns = {item_id: np.asarray(values)[:rows] for item_id, values in columns.items()}
+    return times, columns, meta["state"]
+
+
+# ===================== WRITE =====================
+
+
+def append_cache(source, key_hex, iv_hex, ids, columns, start, state):
+    # Adds bulkdecrypt columns ({"Time": [...], id: [...]}) decoded from
+    # byte start up to state["offset"]. Rows from byte 0 start the cache
+    # over; rows that do not continue it where it stops are not cached.
+    ids = list(ids)
+    bin_path = cache_paths(source)[0]
+    os.makedirs(os.path.dirname(bin_path), exist_ok=True)
+
+    if start == 0 and not len(columns["Time"]):
+        return  # nothing decrypted (wrong key?); keep what is cached
+
+    meta = None if start == 0 else load_meta(source)
+    if start and (
+        meta is None
+        or not os.path.isfile(bin_path)
+        or meta["key"] != key_hash(key_hex, iv_hex)
+        or meta["ids"] != ids
+        or meta["state"]["offset"] != start
+    ):
+        drop_cache(source)
+        return
+
+    times = to_times(columns["Time"]).view(np.int64)
+    count = len(times)
+    records = np.empty((count, len(ids) + 1), "<i8")
+    records[:, 0] = times
+    for k, item_id in enumerate(ids):
+        records[:, k + 1] = to_prices(columns[item_id], count)
+
+    if meta is None:
+        drop_cache(source)  # no stale .json next to a half-written .bin
+        with open(bin_path, "wb") as f:
+            write_header(f, ids)
+            f.write(records.tobytes())
+        rows = count
+    else:
+        with open(bin_path, "r+b") as f:
+            _, offset = read_header(f)
+            # Rows past meta["rows"] are from an interrupted append
+            f.truncate(offset + meta["rows"] * records.shape[1] * 8)
+            f.seek(0, os.SEEK_END)
+            f.write(records.tobytes())
+        rows = meta["rows"] + count
+
+    stat = os.stat(source)
+    save_meta(
+        source,
+        {
+            "key": key_hash(key_hex, iv_hex),
+            "ids": ids,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": source_hash(source, stat.st_size),
+            "rows": rows,
+            "state": state,
+        },
+    )
@@ -0,0 +1,109 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+
+# ===================== SETTINGS =====================
+
+# Overridable from the optional "logging" section of config.json
+DEFAULT_SETTINGS = {
+    "rotate": "size",  # "size" or "time"
+    "max_bytes": 5 * 1024 * 1024,
+    "when": "midnight",
+    "backup_count": 7,
+    "compress": True,
+    "levels": {
+        "": "INFO",
+        "urllib3": "WARNING",
+    },
+}
+
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def load_log_settings(config_path):
+    settings = dict(DEFAULT_SETTINGS)
+    settings["levels"] = dict(DEFAULT_SETTINGS["levels"])
+
+    if os.path.isfile(config_path):
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                custom = json.load(f).get("logging", {})
+        except (OSError, ValueError):
+            custom = {}
+
+        settings["levels"].update(custom.pop("levels", {}))
+        settings.update(custom)
+
+    return settings
+
+
+# ===================== ROTATION =====================
+
+
+def gzip_namer(name):
+    return name + ".gz"
+
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def create_file_handler(log_file, settings):
+    if settings["rotate"] == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_file,
+            when=settings["when"],
+            backupCount=settings["backup_count"],
+            encoding="utf-8",
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=settings["max_bytes"],
+            backupCount=settings["backup_count"],
+            encoding="utf-8",
+        )
+
+    if settings["compress"]:
+        handler.namer = gzip_namer
+        handler.rotator = gzip_rotator
+
+    return handler
+
+
+# ===================== PIPELINE =====================
+
+
+def setup_logging(log_file, settings):
+    # Callers only enqueue records; formatting, file I/O, rotation and
+    # compression all run on the QueueListener's thread
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+
+    handlers = [create_file_handler(log_file, settings), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    for name, level in settings["levels"].items():
+        logging.getLogger(name or None).setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
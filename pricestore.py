@@ -0,0 +1,161 @@
+import numpy as np
+
+# ===================== PRICE STORE =====================
+
+# In-memory price history for the GUI, one NumPy column per field:
+#
+#   times   datetime64[s]  Tehran wall clock, as in the Time column
+#   <name>  int64          price, MISSING where the instrument was absent
+#
+# Rows are kept sorted by time with no repeated timestamp; a merge drops
+# rows whose time is already stored (and repeats inside the batch), so the
+# first copy of a duplicate wins. Columns grow by doubling, and times,
+# column() and span() return views into them, so reading never copies.
+
+MISSING = np.iinfo(np.int64).min  # same sentinel as binstore.MISSING
+
+TIME_DTYPE = "datetime64[s]"
+MIN_CAPACITY = 1024
+
+
+def to_times(times):
+    # "YYYY-MM-DD HH:MM:SS" text, int seconds or datetime64 -> datetime64[s]
+    if isinstance(times, np.ndarray):
+        if times.dtype.kind == "M":
+            return times.astype(TIME_DTYPE)
+        if times.dtype.kind in "iu":
+            return times.astype(np.int64).view(TIME_DTYPE)
+    return np.array(times, dtype=TIME_DTYPE)
+
+
+def to_prices(values, count):
+    # Sequence of ints / None, or an int64 array with MISSING already in it
+    if isinstance(values, np.ndarray):
+        return values.astype(np.int64, copy=False)
+    return np.fromiter((MISSING if v is None else v for v in values), np.int64, count)
+
+
+def time_text(t):
+    return str(t).replace("T", " ")
+
+
+class PriceStore:
+    def __init__(self, names, capacity=MIN_CAPACITY):
+        self.names = list(names)
+        self.size = 0
+        self._times = np.empty(capacity, TIME_DTYPE)
+        self._prices = np.empty((len(self.names), capacity), np.int64)
+        self._row = {name: n for n, name in enumerate(self.names)}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def times(self):
+        return self._times[: self.size]
+
+    def column(self, name):
+        return self._prices[self._row[name], : self.size]
+
+    def clear(self):
+        self.size = 0
+
+    # -------- growth --------
+
+    def reserve(self, count):
+        capacity = len(self._times)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+
+        times = np.empty(capacity, TIME_DTYPE)
+        times[: self.size] = self._times[: self.size]
+        prices = np.empty((len(self.names), capacity), np.int64)
+        prices[:, : self.size] = self._prices[:, : self.size]
+        self._times, self._prices = times, prices
+
+    # -------- merge --------
+
+    def merge(self, times, columns):
+        # Appends rows whose time is new; columns maps name -> values
+        # (instruments left out are MISSING). Returns the number added.
+        times = to_times(times)
+        count = len(times)
+        if not count:
+            return 0
+
+        block = np.full((len(self.names), count), MISSING, np.int64)
+        for name, values in columns.items():
+            if name in self._row:
+                block[self._row[name]] = to_prices(values, count)
+
+        # First copy of each time inside the batch, in batch order
+        unique, first = np.unique(times, return_index=True)
+        if len(unique) != count:
+            keep = np.sort(first)
+            times, block = times[keep], block[:, keep]
+
+        # Times already stored (the store is sorted, so a binary search)
+        if self.size:
+            stored = self.times
+            pos = np.searchsorted(stored, times)
+            found = pos < self.size
+            found[found] = stored[pos[found]] == times[found]
+            if found.any():
+                times, block = times[~found], block[:, ~found]
+
+        added = len(times)
+        if not added:
+            return 0
+
+        start = self.size
+        self.reserve(start + added)
+        self._times[start : start + added] = times
+        self._prices[:, start : start + added] = block
+        self.size += added
+
+        # Re-sort only if the new rows are out of order (stable, times unique)
+        new = self._times[start : self.size]
+        if (start and new[0] < self._times[start - 1]) or np.any(new[1:] < new[:-1]):
+            order = np.argsort(self.times, kind="stable")
+            self._times[: self.size] = self.times[order]
+            self._prices[:, : self.size] = self._prices[:, : self.size][:, order]
+        return added
+
+    def merge_rows(self, rows):
+        # [(time, {name: price}), ...] -> merge
+        times = [t for t, _ in rows]
+        columns = {name: [prices.get(name) for _, prices in rows] for name in self.names}
+        return self.merge(times, columns)
+
+    # -------- queries --------
+
+    def span(self, since=None, until=None):
+        # Row slice for [since, until)
+        start = 0 if since is None else int(np.searchsorted(self.times, to_times([since])[0]))
+        stop = self.size if until is None else int(np.searchsorted(self.times, to_times([until])[0]))
+        return slice(start, stop)
+
+    def series(self, name, since=None, until=None):
+        # (times, prices) of the rows in [since, until) that have a price
+        rows = self.span(since, until)
+        times, prices = self.times[rows], self.column(name)[rows]
+        present = prices != MISSING
+        if present.all():
+            return times, prices
+        return times[present], prices[present]
+
+    def min_max(self, name, since=None, until=None):
+        _, prices = self.series(name, since, until)
+        if not len(prices):
+            return None
+        return int(prices.min()), int(prices.max())
+
+    def row(self, n):
+        # Row n as (time text, {name: price or None})
+        prices = self._prices[:, n]
+        return time_text(self._times[n]), {
+            name: None if prices[k] == MISSING else int(prices[k])
+            for k, name in enumerate(self.names)
+        }
@@ -0,0 +1,177 @@
+import os
+
+from instruments import SCHEMA_TAG, encode_schema, int_to_time, time_to_int
+from writer import PriceWriter
+
+# ===================== RESOLUTIONS =====================
+
+# name -> bucket width in seconds; buckets align to Tehran wall-clock time
+RESOLUTIONS = {
+    "1m": 60,
+    "5m": 300,
+    "1h": 3600,
+    "1d": 86400,
+}
+
+# Per instrument a closed bucket stores open,high,low,close,count
+FIELDS = ("open", "high", "low", "close", "count")
+
+# Seconds between raw rows: the collector's tick (server.TICK_INTERVAL)
+RAW_WIDTH = float(os.environ.get("GCPMS_TICK_INTERVAL", 60))
+
+
+def rollup_path(base_path, name):
+    root, ext = os.path.splitext(base_path)
+    return f"{root}_{name}{ext}"
+
+
+def pick_resolution(span_seconds, max_points=2000, raw_width=RAW_WIDTH):
+    # Finest rollup that still fits the span into max_points buckets, None
+    # when the raw rows already do; a rollup no coarser than the raw rows
+    # is never better than them
+    if span_seconds / raw_width <= max_points:
+        return None
+    for name, width in RESOLUTIONS.items():
+        if width > raw_width and span_seconds / width <= max_points:
+            return name
+    return list(RESOLUTIONS)[-1]
+
+
+def last_bucket(path):
+    # Plaintext time of the final row, read from the file tail only
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        size = 4096
+        while True:
+            start = max(0, end - size)
+            f.seek(start)
+            lines = f.read(end - start).strip().splitlines()
+            if start == 0 or len(lines) > 1:
+                break
+            size *= 4
+
+    if start > 0:
+        lines = lines[1:]  # may begin mid-row
+
+    for line in reversed(lines):
+        t = line.decode("utf-8", "ignore").split(",")[0]
+        if t and t != SCHEMA_TAG:
+            try:
+                return time_to_int(t)
+            except ValueError:
+                return None
+    return None
+
+
+def last_schema(path):
+    # Ciphertext of the final "#schema" line, None if there is none
+    if not os.path.isfile(path):
+        return None
+
+    schema = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(SCHEMA_TAG + ","):
+                schema = line.strip().split(",")[1]
+    return schema
+
+
+# ===================== ROLLUP =====================
+
+
+class Rollup:
+    # Keeps one open bucket per resolution and folds every tick into it in
+    # O(instruments). A bucket is encrypted and appended to its
+    # Prices_<name>.csv when the first tick of the next bucket arrives.
+
+    def __init__(self, base_path, ids, encrypt, fsync="batch", logger=None):
+        self.ids = list(ids)
+        self.encrypt = encrypt
+        self.logger = logger
+
+        self.open_buckets = {name: None for name in RESOLUTIONS}
+        self.last_written = {}
+        self.writers = {}
+
+        # Fixed key and IV: the same schema always encrypts the same way
+        schema = encrypt(encode_schema(self.ids))
+        for name in RESOLUTIONS:
+            path = rollup_path(base_path, name)
+            self.last_written[name] = last_bucket(path)
+            self.writers[name] = PriceWriter(path, 1, 0, fsync, logger)
+            if last_schema(path) != schema:
+                self.writers[name].write_row([SCHEMA_TAG, schema])
+
+    def update(self, time_text, prices):
+        t = time_to_int(time_text)
+
+        for name, width in RESOLUTIONS.items():
+            start = t - t % width
+            bucket = self.open_buckets[name]
+
+            if bucket is not None and bucket[0] != start:
+                self.emit(name, bucket)
+                bucket = None
+            if bucket is None:
+                bucket = self.open_buckets[name] = (start, {})
+
+            stats = bucket[1]
+            for item_id, price in prices.items():
+                if price is None:
+                    continue
+                s = stats.get(item_id)
+                if s is None:
+                    stats[item_id] = [price, price, price, price, 1]
+                else:
+                    if price > s[1]:
+                        s[1] = price
+                    if price < s[2]:
+                        s[2] = price
+                    s[3] = price
+                    s[4] += 1
+
+    def emit(self, name, bucket):
+        start, stats = bucket
+        # Already on disk from before a restart (see replay)
+        if self.last_written[name] is not None and start <= self.last_written[name]:
+            return
+
+        values = []
+        for item_id in self.ids:
+            s = stats.get(item_id)
+            values.append(",".join(map(str, s)) if s else ",,,,")
+
+        self.writers[name].write_row([int_to_time(start), self.encrypt(",".join(values))])
+        self.last_written[name] = start
+
+    def replay_since(self):
+        # Start of the oldest bucket not written yet, over every resolution:
+        # the raw rows from there rebuild all buckets left open by a stop or
+        # crash, however long ago. None (a rollup file without rows) means
+        # the whole history.
+        starts = []
+        for name, width in RESOLUTIONS.items():
+            if self.last_written[name] is None:
+                return None
+            starts.append(self.last_written[name] + width)
+        return int_to_time(min(starts))
+
+    def replay(self, rows):
+        # Rebuilds the open buckets from raw rows after a restart (read from
+        # replay_since()); buckets that were already written are skipped by emit
+        count = 0
+        for time_text, prices in rows:
+            self.update(time_text, prices)
+            count += 1
+        if self.logger:
+            self.logger.info(f"Rollups replayed {count} rows")
+
+    def close(self):
+        # Open buckets are incomplete and not written; the next start
+        # replays the raw rows from replay_since() and writes them once
+        # their bucket has passed
+        for writer in self.writers.values():
+            writer.close()
@@ -0,0 +1,385 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from binstore import make_cipher_funcs
+from blockstore import (
+    BLOCK_FILE,
+    BLOCK_HEADER,
+    FILE_HEADER,
+    JOURNAL_SUFFIX,
+    MAGIC,
+    TAG_SIZE,
+    VERSION,
+    block_key,
+    decrypt_block,
+    encrypt_block,
+    is_block_store,
+    iter_raw_blocks,
+    journal_key,
+)
+from instruments import RUN_TAG
+from rollups import RESOLUTIONS, rollup_path
+from segments import SEGMENT_DIR, file_digest, load_catalog, save_catalog, segment_paths
+
+# ===================== KEY ROTATION =====================
+
+# Re-encrypts the history under a new AES key/IV instead of letting
+# server.py move it aside on a key change. Stop the collector, then:
+#
+#   python rotate.py new_config.json [--config config.json] [--workers 4]
+#
+# Prices.csv, the rollup files, Prices.gcm (and its journal) and the
+# segments/ files are streamed in chunks that
+# worker processes decrypt with the old key and encrypt with the new one;
+# at most 2 chunks per worker are in memory. Output goes to
+# <file>.rotating and replaces the original with os.replace once complete.
+# Progress is saved in rotate_state.json after every chunk (after every
+# file for gzipped segments), so an interrupted run resumes where it stopped
+# when started again with the same arguments. config.json and aes_hash.txt are switched to the new key last.
+
+FILE_NAME = "Prices.csv"
+CONFIG_FILE = "config.json"
+HASH_FILE = "aes_hash.txt"
+STATE_FILE = "rotate_state.json"
+TEMP_SUFFIX = ".rotating"
+
+CHUNK_LINES = 20000
+CHUNK_BLOCKS = 16
+
+HEX_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+HEX_IV_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def load_key_iv(path):
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+
+    key_hex, iv_hex = cfg.get("key"), cfg.get("iv")
+    if not isinstance(key_hex, str) or not HEX_KEY_RE.fullmatch(key_hex):
+        raise ValueError(f"{path}: key must be 64 lowercase hex chars")
+    if not isinstance(iv_hex, str) or not HEX_IV_RE.fullmatch(iv_hex):
+        raise ValueError(f"{path}: iv must be 32 lowercase hex chars")
+    return key_hex, iv_hex
+
+
+def key_iv_hash(key_hex, iv_hex):
+    # Same value server.py keeps in aes_hash.txt
+    return hashlib.sha256(bytes.fromhex(key_hex) + bytes.fromhex(iv_hex)).hexdigest()
+
+
+def write_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ===================== CHUNK WORKERS =====================
+
+
+def rotate_lines(lines, old, new):
+    # CSV chunk: "<time>,<ciphertext>" and "#schema,<ciphertext>" lines get
+    # the new ciphertext; run lines and blank lines carry none
+    _, decrypt = make_cipher_funcs(*old)
+    encrypt, _ = make_cipher_funcs(*new)
+    out = []
+
+    for raw in lines:
+        text = raw.decode("utf-8")
+        body = text.rstrip("\r\n")
+        head, sep, cipher_text = body.partition(",")
+
+        if not sep or not cipher_text or cipher_text.startswith(RUN_TAG):
+            out.append(raw)
+            continue
+
+        try:
+            plain = decrypt(cipher_text)
+        except ValueError:
+            # A torn last line from a crash is kept as it is
+            if raw.endswith(b"\n"):
+                raise
+            out.append(raw)
+            continue
+
+        ending = text[len(body):]
+        out.append(f"{head},{encrypt(plain)}{ending}".encode("utf-8"))
+
+    return b"".join(out)
+
+
+def rotate_blocks(blocks, old_key_hex, new_key_hex, subkey=block_key):
+    # GCM chunk: each block keeps its index, gets a new nonce and key.
+    # subkey: block_key for Prices.gcm, journal_key for its journal
+    old_key = subkey(bytes.fromhex(old_key_hex))
+    new_key = subkey(bytes.fromhex(new_key_hex))
+    return b"".join(
+        encrypt_block(new_key, index, decrypt_block(old_key, index, nonce, ciphertext, tag))
+        for index, nonce, ciphertext, tag in blocks
+    )
+
+
+# ===================== CHUNK READERS =====================
+
+
+def csv_chunks(f, progress, chunk_lines):
+    # Yields (end offset, lines); reads whole lines only
+    offset = progress["offset"]
+    lines = []
+    for line in f:
+        lines.append(line)
+        offset += len(line)
+        if len(lines) >= chunk_lines:
+            yield offset, lines, {}
+            lines = []
+    if lines:
+        yield offset, lines, {}
+
+
+def block_chunks(f, progress, chunk_blocks):
+    first = progress.get("index", 0)
+    blocks, end, index = [], progress["offset"], first
+    for n, offset, nonce, ciphertext, tag in iter_raw_blocks(f):
+        index = first + n
+        blocks.append((index, nonce, ciphertext, tag))
+        end = offset + BLOCK_HEADER.size + len(ciphertext) + TAG_SIZE
+        if len(blocks) >= chunk_blocks:
+            yield end, blocks, {"index": index + 1}
+            blocks = []
+    if blocks:
+        yield end, blocks, {"index": index + 1}
+
+
+# ===================== FILE ROTATION =====================
+
+
+class Rotation:
+    def __init__(self, old, new, workers, chunk_lines=CHUNK_LINES, state_path=STATE_FILE):
+        self.old = old
+        self.new = new
+        self.workers = max(1, workers)
+        self.chunk_lines = chunk_lines
+        self.state_path = state_path
+        self.state = self.load_state()
+        self.pool = ProcessPoolExecutor(self.workers)
+
+    def close(self):
+        self.pool.shutdown()
+
+    def load_state(self):
+        fresh = {"old": key_iv_hash(*self.old), "new": key_iv_hash(*self.new), "files": {}}
+        if not os.path.isfile(self.state_path):
+            return fresh
+
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("new") != fresh["new"]:
+            raise ValueError(
+                f"{self.state_path} belongs to a rotation to a different key; "
+                "finish that one or delete the state file and *.rotating files"
+            )
+        return state
+
+    def save_state(self):
+        write_atomic(self.state_path, json.dumps(self.state, indent=2))
+
+    def start_file(self, path, block):
+        stat = os.stat(path)
+        progress = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "offset": 0,
+            "written": 0,
+            "done": False,
+        }
+        with open(path + TEMP_SUFFIX, "wb") as out:
+            if block:
+                out.write(FILE_HEADER.pack(MAGIC, VERSION))
+                progress["offset"] = progress["written"] = FILE_HEADER.size
+                progress["index"] = 0
+        return progress
+
+    def rotate_file(self, path):
+        if path.endswith(".gz"):
+            return self.rotate_gzip(path)
+
+        block = is_block_store(path)
+        tmp = path + TEMP_SUFFIX
+        progress = self.state["files"].get(path)
+
+        if progress and progress["done"]:
+            return
+        if progress and progress.get("swapping"):
+            return self.swap(path, progress)
+
+        # Resume only if the source is untouched since the last run
+        stat = os.stat(path)
+        if (
+            not progress
+            or not os.path.isfile(tmp)
+            or stat.st_mtime_ns != progress["mtime_ns"]
+            or stat.st_size != progress["size"]
+        ):
+            if progress:
+                print(f"{path}: changed or temp file missing, starting over")
+            progress = self.start_file(path, block)
+        elif progress["offset"]:
+            print(f"{path}: resuming at byte {progress['offset']:,} of {stat.st_size:,}")
+
+        self.state["files"][path] = progress
+        self.save_state()
+
+        if block:
+            subkey = journal_key if path.endswith(JOURNAL_SUFFIX) else block_key
+            func, args = rotate_blocks, (self.old[0], self.new[0], subkey)
+        else:
+            func, args = rotate_lines, (self.old, self.new)
+
+        with open(path, "rb") as src, open(tmp, "r+b") as out:
+            out.truncate(progress["written"])
+            out.seek(progress["written"])
+            src.seek(progress["offset"])
+            if block:
+                chunks = block_chunks(src, progress, CHUNK_BLOCKS)
+            else:
+                chunks = csv_chunks(src, progress, self.chunk_lines)
+
+            # Bounded window of chunks in flight, written back in order
+            pending = deque()
+            for end, payload, extra in chunks:
+                pending.append((end, extra, self.pool.submit(func, payload, *args)))
+                if len(pending) >= self.workers * 2:
+                    self.write_chunk(out, progress, *pending.popleft())
+            while pending:
+                self.write_chunk(out, progress, *pending.popleft())
+
+        if os.path.getsize(path) != progress["size"]:
+            raise RuntimeError(f"{path} changed during rotation; stop the collector and rerun")
+
+        self.swap(path, progress)
+        print(f"{path}: rotated ({progress['written']:,} bytes)")
+
+    def rotate_gzip(self, path):
+        # Closed segments are a day each, so they are redone whole if cut off
+        progress = self.state["files"].get(path, {})
+        if progress.get("done"):
+            return
+        if progress.get("swapping"):
+            return self.swap(path, progress)
+
+        tmp = path + TEMP_SUFFIX
+        with gzip.open(path, "rb") as src, gzip.open(tmp, "wb") as out:
+            pending = deque()
+            for _, lines, _ in csv_chunks(src, {"offset": 0}, self.chunk_lines):
+                pending.append(self.pool.submit(rotate_lines, lines, self.old, self.new))
+                if len(pending) >= self.workers * 2:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
+
+        self.state["files"][path] = progress = {"done": False}
+        self.swap(path, progress)
+
+    def swap(self, path, progress):
+        # "swapping" is saved before the replace: a run stopped between the
+        # two finds it set and finishes the replace (or sees it happened,
+        # the temp file being gone) instead of rotating the new file again
+        tmp = path + TEMP_SUFFIX
+        if not progress.get("swapping"):
+            progress["swapping"] = True
+            self.save_state()
+        if os.path.isfile(tmp):
+            os.replace(tmp, path)
+        progress["done"] = True
+        self.save_state()
+
+    def write_chunk(self, out, progress, end, extra, future):
+        out.write(future.result())
+        out.flush()
+        os.fsync(out.fileno())
+
+        progress["offset"] = end
+        progress["written"] = out.tell()
+        progress.update(extra)
+        self.save_state()
+
+    def finish(self, config_path, hash_path):
+        # Switch the collector to the new key only after every file is done
+        with open(config_path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        cfg["key"], cfg["iv"] = self.new
+        write_atomic(config_path, json.dumps(cfg, indent=4))
+        write_atomic(hash_path, self.state["new"])
+        os.remove(self.state_path)
+
+
+def data_files(base=FILE_NAME):
+    paths = [base] + [rollup_path(base, name) for name in RESOLUTIONS]
+    paths += [BLOCK_FILE, BLOCK_FILE + JOURNAL_SUFFIX]  # the journal's unsealed rows too
+    paths += segment_paths(SEGMENT_DIR)
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def refresh_catalog(directory=SEGMENT_DIR):
+    catalog = load_catalog(directory)
+    for entry in catalog["segments"]:
+        path = os.path.join(directory, entry["name"])
+        if entry["closed"] and os.path.isfile(path):
+            entry["bytes"] = os.path.getsize(path)
+            entry["sha256"] = file_digest(path)
+    if catalog["segments"]:
+        save_catalog(directory, catalog)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt price history under a new AES key")
+    parser.add_argument("new_config", help="JSON file with the new key and iv")
+    parser.add_argument("--config", default=CONFIG_FILE, help="current key/iv, updated at the end")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-lines", type=int, default=CHUNK_LINES)
+    args = parser.parse_args()
+
+    old = load_key_iv(args.config)
+    new = load_key_iv(args.new_config)
+
+    if old == new:
+        if os.path.isfile(STATE_FILE):
+            # Interrupted between the config and hash file updates
+            write_atomic(HASH_FILE, key_iv_hash(*new))
+            os.remove(STATE_FILE)
+            print("Rotation finished")
+        else:
+            print("Keys are identical, nothing to do")
+        return
+
+    if os.path.isfile(HASH_FILE):
+        with open(HASH_FILE, "r") as f:
+            if f.read().strip() != key_iv_hash(*old):
+                sys.exit(f"{args.config} does not match {HASH_FILE}; the data is under another key")
+
+    rotation = Rotation(old, new, args.workers, args.chunk_lines)
+    try:
+        for path in data_files():
+            rotation.rotate_file(path)
+    except ValueError as e:
+        sys.exit(f"Rotation stopped: {e} (is {args.config} the key the data was written with?)")
+    finally:
+        rotation.close()
+
+    refresh_catalog()
+
+    rotation.finish(args.config, HASH_FILE)
+    print(f"{args.config} and {HASH_FILE} now use the new key")
+
+
+if __name__ == "__main__":
+    main()
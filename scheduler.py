@@ -0,0 +1,84 @@
+import asyncio
+import random
+import time
+
+# ===================== BACKOFF =====================
+
+
+def backoff_delay(attempt, base, cap):
+    # Full jitter: uniform in [0, base * 2^(attempt-1)], capped
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+# ===================== CLOCK =====================
+
+
+def scaled_clock(scale, start=None):
+    # Simulated wall clock running scale times faster than real time, for
+    # load tests that need hours of ticks in minutes
+    if scale == 1 and start is None:
+        return time.time
+
+    origin = time.time() if start is None else start
+    began = time.monotonic()
+    return lambda: origin + (time.monotonic() - began) * scale
+
+
+# ===================== TICK SCHEDULER =====================
+
+
+class TickScheduler:
+    # Fires on wall-clock multiples of interval (e.g. every :00 for 60 s), so
+    # scrape time never drifts the period. Late ticks skip to the next
+    # boundary instead of firing back to back.
+
+    def __init__(self, interval, clock=time.time, logger=None, scale=1.0, on_late=None):
+        # scale: clock seconds per real second (see scaled_clock);
+        # on_late(missed) is called once per overrun with the ticks skipped
+        self.interval = interval
+        self.clock = clock
+        self.scale = scale
+        self.logger = logger
+        self.on_late = on_late
+
+        self.next_tick = None
+        self.ticks = 0
+        self.skipped = 0
+        self.overruns = 0
+
+    def next_boundary(self, now):
+        return (now // self.interval + 1) * self.interval
+
+    def time_left(self):
+        # Seconds until the next tick is due
+        if self.next_tick is None:
+            return self.interval
+        return max(0.0, self.next_tick - self.clock())
+
+    async def wait(self):
+        now = self.clock()
+
+        if self.next_tick is None:
+            self.next_tick = self.next_boundary(now)
+
+        elif now >= self.next_tick:
+            late = now - self.next_tick
+            missed = int(late // self.interval) + 1
+            self.overruns += 1
+            self.skipped += missed
+            self.next_tick += missed * self.interval
+            if self.on_late:
+                self.on_late(missed)
+
+            if self.logger:
+                self.logger.warning(
+                    f"Tick overran by {late:.1f}s, skipped {missed} "
+                    f"(total skipped {self.skipped})"
+                )
+
+        await asyncio.sleep(max(0.0, self.next_tick - now) / self.scale)
+
+        tick_time = self.next_tick
+        self.next_tick += self.interval
+        self.ticks += 1
+        return tick_time
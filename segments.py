@@ -0,0 +1,354 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from instruments import SCHEMA_TAG, int_to_time, is_run_line, run_times
+from rollups import last_bucket
+from writer import PriceWriter
+
+# ===================== LAYOUT =====================
+
+# Time-partitioned Prices.csv: one segment per day (or month) in SEGMENT_DIR.
+#
+#   segments/catalog.json           which segments exist and what they hold
+#   segments/Prices-2025-01-01.csv.gz   closed segment, gzip
+#   segments/Prices-2025-01-02.csv      active segment, appended to
+#
+# A segment uses the Prices.csv line format and starts with its own
+# "#schema" line, and never starts with a run line, so every segment can be
+# read on its own. The partition key is the prefix of the plaintext
+# timestamp, so the segments overlapping a time range are found from the
+# catalog alone. A closed segment's entry also carries the sha256 of its
+# .gz, so a copy elsewhere can tell it is stale even at the same size.
+
+SEGMENT_DIR = "segments"
+CATALOG_FILE = "catalog.json"
+
+# Partition key = first N characters of "YYYY-MM-DD HH:MM:SS"
+SPANS = {
+    "day": 10,
+    "month": 7,
+}
+
+
+def partition_key(time_text, span="day"):
+    return time_text[: SPANS[span]]
+
+
+def segment_name(key, compressed=False):
+    return f"Prices-{key}.csv" + (".gz" if compressed else "")
+
+
+def overlaps(key, since=None, until=None):
+    # Every timestamp in the segment starts with key
+    return (since is None or key + "~" > since) and (until is None or key < until)
+
+
+# ===================== CATALOG =====================
+
+
+def load_catalog(directory, span="day"):
+    path = os.path.join(directory, CATALOG_FILE)
+    if not os.path.isfile(path):
+        return {"span": span, "segments": []}
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_catalog(directory, catalog):
+    path = os.path.join(directory, CATALOG_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def is_segment_dir(path):
+    return os.path.isfile(os.path.join(path, CATALOG_FILE))
+
+
+def active_segment(catalog):
+    for entry in reversed(catalog["segments"]):
+        if not entry["closed"]:
+            return entry
+    return None
+
+
+def segment_paths(directory, since=None, until=None):
+    # Paths of the segments that can hold rows in [since, until), oldest first
+    catalog = load_catalog(directory)
+    paths = [
+        os.path.join(directory, entry["name"])
+        for entry in catalog["segments"]
+        if overlaps(entry["key"], since, until)
+    ]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def open_segment(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def first_time(path):
+    with open_segment(path) as f:
+        for line in f:
+            t = line.split(",", 1)[0]
+            if t and t != SCHEMA_TAG:
+                return t.strip()
+    return None
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def last_time(path):
+    last = None
+    with open_segment(path) as f:
+        for line in f:
+            t = line.split(",", 1)[0].strip()
+            if t and t != SCHEMA_TAG:
+                last = t
+    return last
+
+
+def close_entry(directory, entry):
+    # Marks the entry closed on its .gz
+    target = os.path.join(directory, segment_name(entry["key"], True))
+    entry["name"] = os.path.basename(target)
+    entry["bytes"] = os.path.getsize(target)
+    entry["sha256"] = file_digest(target)
+    entry["closed"] = True
+
+
+def compress_segment(directory, entry, catalog=None):
+    # Closes a segment: records its range, gzips it and drops the plain file.
+    # With catalog, the closed entry is saved before the plain file goes, so
+    # a crash leaves a pair that reconcile() sorts out, never a lost day.
+    path = os.path.join(directory, entry["name"])
+    last = last_bucket(path)
+    entry["first"] = first_time(path)
+    entry["last"] = int_to_time(last) if last is not None else None
+
+    target = os.path.join(directory, segment_name(entry["key"], True))
+    with open(path, "rb") as src, gzip.open(target + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(target + ".tmp", target)
+
+    close_entry(directory, entry)
+    if catalog is not None:
+        save_catalog(directory, catalog)
+    os.remove(path)
+
+
+def reconcile(directory, catalog):
+    # Repairs what a crash while closing a segment leaves; True if the
+    # catalog changed and must be saved
+    changed = False
+    by_key = {entry["key"]: entry for entry in catalog["segments"]}
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith("Prices-") and name.endswith(".gz.tmp"):
+            os.remove(path)  # gzip cut off before its rename
+            continue
+        if not (name.startswith("Prices-") and name.endswith(".csv.gz")):
+            continue
+
+        key = name[len("Prices-"):-len(".csv.gz")]
+        entry = by_key.get(key)
+        plain = os.path.join(directory, segment_name(key))
+
+        if entry is not None and entry["closed"]:
+            if os.path.isfile(plain):
+                os.remove(plain)  # closed and saved, plain file not yet removed
+        elif os.path.isfile(plain):
+            os.remove(path)  # gzipped but not recorded: the plain file is current
+        else:
+            # Plain file removed before the catalog was saved: adopt the .gz
+            if entry is None:
+                entry = by_key[key] = {"key": key}
+                catalog["segments"].append(entry)
+            entry["first"], entry["last"] = first_time(path), last_time(path)
+            close_entry(directory, entry)
+            changed = True
+
+    if changed:
+        catalog["segments"].sort(key=lambda entry: entry["key"])
+    return changed
+
+
+# ===================== WRITER =====================
+
+
+class SegmentWriter(PriceWriter):
+    # Appends to the active segment only. A row from a new partition closes
+    # the active segment (gzip + catalog entry) and opens the next one,
+    # which starts with schema_row.
+
+    def __init__(self, directory, schema_row, *args, span="day", **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.directory = directory
+        self.schema_row = schema_row
+        self.span = span
+
+        os.makedirs(directory, exist_ok=True)
+        self.catalog = load_catalog(directory, span)
+        if reconcile(directory, self.catalog):
+            save_catalog(directory, self.catalog)
+        self.entry = active_segment(self.catalog)
+        if self.entry:
+            self.file_path = os.path.join(directory, self.entry["name"])
+
+    def active_path(self):
+        return self.file_path
+
+    def write_row(self, row):
+        key = partition_key(row[0], self.span)
+        if self.entry is None or key != self.entry["key"]:
+            self.roll(key)
+        super().write_row(row)
+
+    def roll(self, key):
+        self.flush()
+        self.close_file()
+
+        if self.entry is not None:
+            if os.path.isfile(self.file_path):
+                compress_segment(self.directory, self.entry, self.catalog)
+                if self.logger:
+                    self.logger.info(
+                        f"Segment {self.entry['key']} closed ({self.entry['bytes']:,} bytes)"
+                    )
+            else:
+                self.catalog["segments"].remove(self.entry)  # nothing was ever flushed
+
+        self.entry = {
+            "key": key,
+            "name": segment_name(key),
+            "first": None,
+            "last": None,
+            "closed": False,
+        }
+        self.catalog["segments"].append(self.entry)
+        save_catalog(self.directory, self.catalog)
+
+        self.file_path = os.path.join(self.directory, self.entry["name"])
+        self.buffer.append(self.schema_row)
+
+    def flush(self):
+        if self.file_path is not None:
+            super().flush()
+
+
+# ===================== SPLIT / JOIN =====================
+
+
+def split_lines(lines, span="day"):
+    # Yields (key, line) for a Prices.csv stream. The current schema line is
+    # repeated at the top of every segment, and a run line crossing a
+    # boundary is cut in two: the part in the new segment starts with a
+    # full copy of the repeated row. No decryption is needed.
+    schema, last_time, last_row = None, None, None
+    current = None
+
+    for line in lines:
+        fields = line.rstrip("\r\n").split(",")
+        if len(fields) < 2:
+            continue
+
+        if fields[0] == SCHEMA_TAG:
+            schema = line
+            if current is not None:
+                yield current, line
+            continue
+
+        key = partition_key(fields[0], span)
+
+        if is_run_line(fields) and key != current:
+            times = run_times(last_time, fields)
+            before = [t for t in times if partition_key(t, span) == current]
+            after = [t for t in times if partition_key(t, span) != current]
+            if before:
+                yield current, f"{before[-1]},={len(before)}\r\n"
+
+            while after:
+                key = partition_key(after[0], span)
+                part = [t for t in after if partition_key(t, span) == key]
+                after = after[len(part):]
+                if schema:
+                    yield key, schema
+                yield key, f"{part[0]},{last_row}\r\n"
+                if len(part) > 1:
+                    yield key, f"{part[-1]},={len(part) - 1}\r\n"
+
+            current, last_time = key, fields[0]
+            continue
+
+        if key != current:
+            if schema:
+                yield key, schema
+            current = key
+
+        if not is_run_line(fields):
+            last_row = fields[1]
+        last_time = fields[0]
+        yield key, line
+
+
+def split_file(csv_path, directory, span="day"):
+    os.makedirs(directory, exist_ok=True)
+    catalog = {"span": span, "segments": []}
+    out, entry = None, None
+
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for key, line in split_lines(f, span):
+            if entry is None or key != entry["key"]:
+                if out:
+                    out.close()
+                    compress_segment(directory, entry, catalog)
+                entry = {"key": key, "name": segment_name(key), "first": None,
+                         "last": None, "closed": False}
+                catalog["segments"].append(entry)
+                out = open(os.path.join(directory, entry["name"]), "w", encoding="utf-8", newline="")
+            out.write(line if line.endswith("\n") else line + "\r\n")
+
+    if out:
+        out.close()
+    save_catalog(directory, catalog)
+    return len(catalog["segments"])
+
+
+def join_segments(directory, csv_path):
+    with open(csv_path, "w", encoding="utf-8", newline="") as out:
+        for path in segment_paths(directory):
+            with open_segment(path) as f:
+                shutil.copyfileobj(f, out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split Prices.csv into segments or join them back")
+    parser.add_argument("direction", choices=["split", "join"])
+    parser.add_argument("csv", help="Prices.csv path")
+    parser.add_argument("directory", nargs="?", default=SEGMENT_DIR)
+    parser.add_argument("--span", choices=list(SPANS), default="day")
+    args = parser.parse_args()
+
+    if args.direction == "split":
+        count = split_file(args.csv, args.directory, args.span)
+        print(f"{count} segments written to {args.directory}")
+    else:
+        join_segments(args.directory, args.csv)
+        print(f"{args.directory} joined into {args.csv}")
@@ -1,5 +1,5 @@
 import requests
-from bs4 import BeautifulSoup
+import asyncio
 import time
 import datetime
 import csv
@@ -12,19 +12,117 @@ import sys
 import re
 import hashlib
 import secrets
+import signal
+import threading
 
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad
+from Crypto.Util.Padding import pad, unpad
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+from extractor import extract_prices
+from logsetup import load_log_settings, setup_logging
+from scheduler import TickScheduler, backoff_delay, scaled_clock
+from writer import PriceWriter, RunLengthEncoder
+from binstore import BIN_FILE, MISSING, BinaryWriter, read_columns
+from blockstore import BLOCK_FILE, JOURNAL_SUFFIX, BlockWriter, iter_rows
+from api import start_api
+from workers import WorkerPool
+from metrics import counter, histogram, start_metrics_server
+from rollups import RESOLUTIONS, Rollup, rollup_path
+from segments import (
+    CATALOG_FILE,
+    SEGMENT_DIR,
+    SegmentWriter,
+    open_segment,
+    partition_key,
+    segment_paths,
+)
+from instruments import (
+    LEGACY_COLUMNS,
+    SCHEMA_TAG,
+    decode_schema,
+    encode_schema,
+    int_to_time,
+    is_run_line,
+    item_ids,
+    load_instruments,
+    run_times,
+)
+
 # ===================== CONFIG =====================
 
-URL = "https://www.tgju.org/"
+# GCPMS_URL points the collector at another page, e.g. the load-test stub
+URL = os.environ.get("GCPMS_URL", "https://www.tgju.org/")
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
     "Cache-Control": "no-cache",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
 }
 
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+POOL_SIZE = 4
+
+EXTRACTOR = "fast"  # "fast" (regex scan, bs4 fallback) or "bs4"
+
+# Pages fetched concurrently every tick; earlier sources win when several
+# report the same item. "items" limits a source to a subset of ITEM_IDS.
+SOURCES = [
+    {"name": "tgju", "url": URL},
+]
+SOURCES_FILE = "sources.json"
+
+# Fetch and parse in this many worker processes (workers.py), sources dealt
+# out round-robin; 0 keeps everything in the collector process
+WORKERS = int(os.environ.get("GCPMS_WORKERS", 0))
+
+TICK_INTERVAL = float(os.environ.get("GCPMS_TICK_INTERVAL", 60))  # seconds
+TICK_DEADLINE = 45  # seconds; sources still running after this are missing
+RETRY_DELAY = 1  # first backoff step, doubled per attempt with full jitter
+RETRY_MAX_DELAY = 8
+
+# Load tests only (benchmarks/loadtest.py): simulated seconds per real second.
+# Tick times, deadlines and row timestamps follow the simulated clock.
+TIME_SCALE = float(os.environ.get("GCPMS_TIME_SCALE", 1))
+
+# Rows are buffered and appended once FLUSH_ROWS are waiting or
+# FLUSH_INTERVAL seconds have passed. FSYNC_POLICY: "none", "batch" or "row".
+FLUSH_ROWS = 10
+FLUSH_INTERVAL = 60
+FSYNC_POLICY = "batch"
+
+# "csv": encrypted Prices.csv, "binary": plain fixed-width Prices.bin (binstore.py),
+# "block": AES-GCM blocks of many rows in Prices.gcm (blockstore.py),
+# "segments": Prices.csv rows split into daily files under segments/, closed
+# days gzipped (segments.py)
+STORAGE = "csv"
+SEGMENT_SPAN = "day"  # or "month"
+
+# CSV and segments: write a row only when a price changes; repeats become
+# "<time>,=<n>" run lines, written at least every HEARTBEAT_INTERVAL seconds
+CHANGE_ONLY = False
+HEARTBEAT_INTERVAL = 3600
+
+# Block mode seals one block per flush, so it batches more than the CSV writer;
+# rows not sealed yet are journaled (Prices.gcm.journal) and recovered on start
+BLOCK_ROWS = 60
+BLOCK_INTERVAL = 3600
+
+# OHLC rollups (rollups.py) kept next to Prices.csv as Prices_<res>.csv
+ROLLUPS_ENABLED = True
+
+# Local read API (api.py); rows are served decrypted, so keep it on localhost
+API_ENABLED = True
+API_HOST = "127.0.0.1"
+API_PORT = int(os.environ.get("GCPMS_API_PORT", 8321))
+
+# Prometheus text metrics (metrics.py) at http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.environ.get("GCPMS_METRICS_PORT", 9321))
+
 FILE_NAME = "Prices.csv"
 LOG_FILE = "server_log.log"
 CONFIG_FILE = "config.json"
@@ -34,15 +132,32 @@ iran_tz = pytz.timezone("Asia/Tehran")
 
 # ===================== LOGGING =====================
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[logging.FileHandler(LOG_FILE, encoding="utf-8"), logging.StreamHandler()],
-)
+# Queue-based: records are handed to a background listener thread that
+# writes, rotates and gzips server_log.log. Levels come from config.json.
+log_listener = setup_logging(LOG_FILE, load_log_settings(CONFIG_FILE))
 
 logger = logging.getLogger("TGJU-Logger")
 
+# ===================== METRICS =====================
+
+FETCH_SECONDS = histogram("gcpms_fetch_seconds", "Page download time per source")
+HTTP_RESPONSES = counter("gcpms_http_responses_total", "HTTP responses by source and status")
+FETCH_RETRIES = counter("gcpms_fetch_retries_total", "Failed fetch attempts per source")
+PARSE_SECONDS = histogram("gcpms_parse_seconds", "HTML price extraction time per source")
+INSTRUMENT_MISSING = counter(
+    "gcpms_instrument_missing_total", "Ticks without a price per instrument"
+)
+ENCRYPT_SECONDS = histogram("gcpms_encrypt_seconds", "encrypt_data duration")
+WRITE_ROW_SECONDS = histogram(
+    "gcpms_write_row_seconds", "Handing a tick's rows to the writer, flush included when due"
+)
+TICK_SECONDS = histogram("gcpms_tick_seconds", "Time from tick start to row written")
+TICK_OVERRUNS = counter("gcpms_tick_overruns_total", "Ticks that ran past their period")
+TICKS_SKIPPED = counter(
+    "gcpms_ticks_skipped_total", "Tick boundaries skipped after an overrun"
+)
+TICK_ERRORS = counter("gcpms_tick_errors_total", "Ticks that failed to produce a row")
+
 # ===================== VALIDATION =====================
 
 HEX_KEY_RE = re.compile(r"^[0-9a-f]{64}$")  # 32 bytes
@@ -95,7 +210,7 @@ def load_and_validate_aes(config_path):
         sys.exit(1)
 
 
-# ===================== CSV RESET ON KEY CHANGE =====================
+# ===================== KEY CHANGE =====================
 
 
 def get_key_iv_hash(key: bytes, iv: bytes) -> str:
@@ -111,11 +226,23 @@ def check_reset_csv(key: bytes, iv: bytes):
             previous_hash = f.read().strip()
 
     if previous_hash != current_hash:
-        logger.warning("AES key/IV changed → clearing Prices.csv")
-
-        if os.path.isfile(FILE_NAME):
-            os.remove(FILE_NAME)
-            logger.info("Prices.csv removed")
+        # Data under the old key is kept as <file>.<old hash>; rotate.py
+        # re-encrypts history in place instead when run before the switch
+        suffix = (previous_hash or "unknown")[:12]
+        rollup_files = [rollup_path(FILE_NAME, name) for name in RESOLUTIONS]
+        block_files = [BLOCK_FILE, BLOCK_FILE + JOURNAL_SUFFIX]
+        existing = [p for p in [FILE_NAME] + block_files + rollup_files if os.path.isfile(p)]
+        if os.path.isdir(SEGMENT_DIR):
+            existing.append(SEGMENT_DIR)
+
+        if existing:
+            logger.warning(
+                f"AES key/IV changed → moving old data aside as *.{suffix} "
+                "(use rotate.py to keep history across key changes)"
+            )
+        for path in existing:
+            os.replace(path, f"{path}.{suffix}")
+            logger.info(f"{path} moved to {path}.{suffix}")
 
         with open(HASH_FILE, "w") as f:
             f.write(current_hash)
@@ -126,93 +253,546 @@ def check_reset_csv(key: bytes, iv: bytes):
 key, iv = load_and_validate_aes(CONFIG_FILE)
 check_reset_csv(key, iv)
 
+# ===================== HTTP SESSION =====================
+
+# (thread, url) -> requests.Session, one pool per source and fetch thread:
+# a fetch still running after its tick deadline is cancelled never shares a
+# session with the next tick's fetch
+_sessions = {}
+_page_cache = {}  # url -> {"etag", "last_modified", "text"}
+
+
+def create_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    session_key = (threading.get_ident(), url)
+    if session_key not in _sessions:
+        _sessions[session_key] = create_session()
+    return _sessions[session_key]
+
+
+def close_session(url=None):
+    # url: this thread's session for it; None: every session (shutdown)
+    if url:
+        keys = [(threading.get_ident(), url)]
+    else:
+        keys = list(_sessions)
+    for session_key in keys:
+        session = _sessions.pop(session_key, None)
+        if session is not None:
+            session.close()
+
+
+def fetch_page(url=None, source="tgju", timeout=None):
+    # A failed request may leave a dead connection in the pool; the next
+    # attempt starts from a fresh session
+    url = url or URL
+    try:
+        return fetch_conditional(url, source, timeout or (CONNECT_TIMEOUT, READ_TIMEOUT))
+    except RequestException:
+        close_session(url)
+        raise
+
+
+def fetch_conditional(url, source, timeout):
+    # Conditional GET: an unchanged page comes back as an empty 304
+    headers = {}
+    cached = _page_cache.get(url)
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    with FETCH_SECONDS.time(source=source):
+        response = get_session(url).get(url, headers=headers, timeout=timeout)
+    HTTP_RESPONSES.inc(source=source, status=response.status_code)
+    logger.debug(f"{url} HTTP {response.status_code}")
+
+    if response.status_code == 304 and cached:
+        return cached["text"]
+
+    response.raise_for_status()
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        _page_cache[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "text": response.text,
+        }
+    else:
+        _page_cache.pop(url, None)
+
+    return response.text
+
+
 # ===================== PRICE FUNCTIONS =====================
 
 
-def fetch_price(item_id, retries=3):
+def fetch_snapshot(item_ids, retries=3):
+    # One download and one parse for every item, so all prices share a moment
     for attempt in range(1, retries + 1):
         try:
-            logger.info(f"Fetching {item_id} (attempt {attempt})")
+            logger.info(f"Fetching snapshot of {len(item_ids)} items (attempt {attempt})")
+
+            return extract_prices(fetch_page(), item_ids, EXTRACTOR, logger)
+
+        except (RequestException, RuntimeError, ValueError) as e:
+            logger.warning(f"Snapshot failed: {e}")
+
+        if attempt < retries:
+            time.sleep(backoff_delay(attempt, RETRY_DELAY, RETRY_MAX_DELAY))
+
+    raise RuntimeError("Snapshot failed after retries")
+
+
+def fetch_price(item_id, retries=3):
+    return fetch_snapshot([item_id], retries)[item_id]
+
+
+# Column order of the encrypted row, taken from the instrument registry
+INSTRUMENTS = load_instruments()
+ITEM_IDS = item_ids(INSTRUMENTS)
+
+
+# ===================== ASYNC COLLECTOR =====================
+
+
+def load_sources(path):
+    if not os.path.isfile(path):
+        return SOURCES
+
+    with open(path, "r", encoding="utf-8") as f:
+        sources = json.load(f)
+
+    for source in sources:
+        if not source.get("name") or not source.get("url"):
+            raise ValueError(f"Source needs a name and url: {source}")
 
-            response = requests.get(URL, headers=HEADERS, timeout=10)
-            logger.debug(f"{item_id} HTTP {response.status_code}")
-            response.raise_for_status()
+    logger.info(f"Loaded {len(sources)} sources from {path}")
+    return sources
 
-            soup = BeautifulSoup(response.text, "html.parser")
-            item = soup.find("li", id=item_id)
 
-            if not item:
-                raise RuntimeError("Item not found in HTML")
+def learn_expected(source, prices):
+    # The ids a source is expected to carry: its "items" if configured,
+    # otherwise what its first parsed page had (the bs4 fallback included).
+    # Only those send a later page to the bs4 fallback.
+    if "expected" not in source:
+        source["expected"] = source.get("items") or sorted(prices)
 
-            price_text = item.find("span", class_="info-price").text.strip()
-            return int(price_text.replace(",", ""))
+
+async def fetch_source(source, item_ids, retries=3, until=None):
+    # until: loop time after which no further retry is started
+    loop = asyncio.get_running_loop()
+    name = source["name"]
+    items = source.get("items") or item_ids
+
+    for attempt in range(1, retries + 1):
+        try:
+            logger.info(f"Fetching {name} (attempt {attempt})")
+
+            # Socket timeouts within the deadline, so a fetch cut off by it
+            # stops soon after instead of holding its thread
+            timeout = None
+            if until is not None:
+                left = max(0.1, until - loop.time())
+                timeout = (min(CONNECT_TIMEOUT, left), min(READ_TIMEOUT, left))
+            html = await asyncio.to_thread(fetch_page, source["url"], name, timeout)
+            start = time.perf_counter()
+            prices = await asyncio.to_thread(
+                extract_prices, html, items, EXTRACTOR, logger, False, source.get("expected")
+            )
+            PARSE_SECONDS.observe(time.perf_counter() - start, source=name)
+            if not prices:
+                raise RuntimeError("No items found in HTML")
+            learn_expected(source, prices)
+            return prices
 
         except (RequestException, RuntimeError, ValueError) as e:
-            logger.warning(f"{item_id} failed: {e}")
-            time.sleep(5)
+            logger.warning(f"{name} failed: {e}")
+
+        FETCH_RETRIES.inc(source=name)
+        if attempt < retries:
+            delay = backoff_delay(attempt, RETRY_DELAY, RETRY_MAX_DELAY)
+            if until is not None and loop.time() + delay >= until:
+                break
+            await asyncio.sleep(delay)
+
+    raise RuntimeError(f"{name} failed after {attempt} attempts")
+
+
+async def collect_tick(sources, item_ids, deadline=TICK_DEADLINE):
+    until = asyncio.get_running_loop().time() + deadline
+    tasks = {
+        asyncio.create_task(fetch_source(source, item_ids, until=until)): source["name"]
+        for source in sources
+    }
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in pending:
+        task.cancel()
+        logger.warning(f"{tasks[task]} missed the {deadline}s tick deadline")
+
+    results = {}
+    for task in done:
+        if task.exception():
+            logger.warning(f"{tasks[task]} dropped from tick: {task.exception()}")
+        else:
+            results[tasks[task]] = task.result()
 
-    raise RuntimeError(f"{item_id} failed after retries")
+    return merge_results(sources, results)
 
 
-def get_tether_price():
-    return fetch_price("l-crypto-tether-irr")
+async def collect_tick_workers(pool, sources, tick, deadline):
+    # Same result as collect_tick, with the work done in pool's processes
+    replies, missing = await pool.collect(tick, deadline)
+    for name in missing:
+        logger.warning(f"{name} dropped from tick: its worker did not reply")
 
+    results = {}
+    for reply in replies:
+        results.update(reply["prices"])
+        for name, error in reply["errors"].items():
+            logger.warning(f"{name} dropped from tick: {error}")
+        for name in reply["fetch"]:
+            FETCH_RETRIES.inc(reply["retries"][name], source=name)
+            for status in reply["status"][name]:
+                HTTP_RESPONSES.inc(source=name, status=status)
+            if reply["status"][name]:
+                FETCH_SECONDS.observe(reply["fetch"][name] / len(reply["status"][name]), source=name)
+            if name in reply["prices"]:
+                PARSE_SECONDS.observe(reply["parse"][name], source=name)
 
-def get_usd_price():
-    return fetch_price("l-price_dollar_rl")
+    return merge_results(sources, results)
 
 
-def get_gold_price():
-    return fetch_price("l-geram18")
+def merge_results(sources, results):
+    # Merge in source order so the first configured source wins
+    prices = {}
+    for source in sources:
+        for item_id, price in results.get(source["name"], {}).items():
+            prices.setdefault(item_id, price)
 
+    missing = [source["name"] for source in sources if source["name"] not in results]
+    return prices, missing
 
-def get_coin_price():
-    return fetch_price("l-sekee")
+
+def format_row(prices, item_ids):
+    # Missing items are left empty so the column order never shifts
+    return ",".join(str(prices.get(item_id, "")) for item_id in item_ids)
 
 
 # ===================== ENCRYPT & SAVE =====================
 
 
 def encrypt_data(data: str) -> str:
+    with ENCRYPT_SECONDS.time():
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+        encrypted = cipher.encrypt(pad(data.encode(), AES.block_size))
+        return base64.b64encode(encrypted).decode()
+
+
+def decrypt_data(data: str) -> str:
     cipher = AES.new(key, AES.MODE_CBC, iv)
-    encrypted = cipher.encrypt(pad(data.encode(), AES.block_size))
-    return base64.b64encode(encrypted).decode()
+    decrypted = unpad(cipher.decrypt(base64.b64decode(data)), AES.block_size)
+    return decrypted.decode()
+
+
+def read_schema(file_path):
+    # Column ids in force at the end of the file, None for an empty file
+    schema = None
+
+    if not os.path.isfile(file_path):
+        return schema
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(SCHEMA_TAG + ","):
+                schema = decode_schema(decrypt_data(line.strip().split(",")[1]))
+            elif schema is None and line.strip():
+                schema = LEGACY_COLUMNS
+
+    return schema
+
+
+def ensure_schema(file_path, ids):
+    if read_schema(file_path) != ids:
+        write_to_csv(file_path, [SCHEMA_TAG, encrypt_data(encode_schema(ids))])
+        logger.info(f"Schema written: {len(ids)} instruments")
 
 
 def write_to_csv(file_path, row):
     try:
         with open(file_path, "a", newline="", encoding="utf-8") as f:
             csv.writer(f).writerow(row)
-            logger.info("Row written to CSV")
+        logger.debug("Row written to CSV")
     except Exception as e:
         logger.error(f"CSV write error: {e}", exc_info=True)
 
 
+# ===================== READ =====================
+
+
+def store_path():
+    if STORAGE == "segments":
+        # Every append lands in the active segment; the catalog changes on roll
+        paths = segment_paths(SEGMENT_DIR)
+        return paths[-1] if paths else os.path.join(SEGMENT_DIR, CATALOG_FILE)
+    return {"binary": BIN_FILE, "block": BLOCK_FILE}.get(STORAGE, FILE_NAME)
+
+
+def in_range(t, since, until):
+    return (since is None or t >= since) and (until is None or t < until)
+
+
+def read_csv_rows(f, since=None, until=None):
+    columns = LEGACY_COLUMNS
+    encrypted, values, last_time = None, None, None
+    for line in f:
+        # A torn last line (the writer mid-append) is left for the next read
+        if not line.endswith("\n"):
+            break
+        fields = line.strip().split(",")
+        if len(fields) < 2:
+            continue
+        if fields[0] == SCHEMA_TAG:
+            columns = decode_schema(decrypt_data(fields[1]))
+            continue
+
+        if is_run_line(fields):
+            times = run_times(last_time, fields)
+        else:
+            encrypted, values = fields[1], None
+            times = [fields[0]]
+        last_time = fields[0]
+
+        # Plaintext timestamps let out-of-range rows skip decryption
+        for t in times:
+            if not in_range(t, since, until):
+                continue
+            if values is None:
+                decrypted = decrypt_data(encrypted).split(",")
+                values = {i: int(v) if v else None for i, v in zip(columns, decrypted)}
+            yield t, values
+
+
+def read_rows(since=None, until=None):
+    # Yields (time, {id: price or None}) from whichever store is active
+    if STORAGE == "segments":
+        # Only the segments whose day overlaps [since, until) are opened
+        for path in segment_paths(SEGMENT_DIR, since, until):
+            with open_segment(path) as f:
+                yield from read_csv_rows(f, since, until)
+        return
+
+    path = store_path()
+    if not os.path.isfile(path):
+        return
+
+    if STORAGE == "binary":
+        ids, times, columns = read_columns(path)
+        for n, t in enumerate(times):
+            text = int_to_time(t)
+            if in_range(text, since, until):
+                yield text, {
+                    i: None if columns[i][n] == MISSING else columns[i][n] for i in ids
+                }
+
+    elif STORAGE == "block":
+        for t, values in iter_rows(path, key):
+            if in_range(t, since, until):
+                yield t, {i: int(v) if v else None for i, v in values.items()}
+
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from read_csv_rows(f, since, until)
+
+
 # ===================== MAIN =====================
 
-if __name__ == "__main__":
-    logger.info("TGJU price logger started")
 
+def record_overrun(missed):
+    TICK_OVERRUNS.inc()
+    TICKS_SKIPPED.inc(missed)
+
+
+async def run_collector():
+    sources = load_sources(SOURCES_FILE)
+    scheduler = TickScheduler(
+        TICK_INTERVAL, scaled_clock(TIME_SCALE), logger, TIME_SCALE, record_overrun
+    )
+
+    if STORAGE == "binary":
+        writer = BinaryWriter(
+            BIN_FILE, ITEM_IDS, FLUSH_ROWS, FLUSH_INTERVAL, FSYNC_POLICY, logger
+        )
+        try:
+            writer.open()
+        except ValueError as e:
+            logger.critical(f"Binary store unusable: {e}")
+            sys.exit(1)
+    elif STORAGE == "block":
+        writer = BlockWriter(
+            BLOCK_FILE, ITEM_IDS, key, BLOCK_ROWS, BLOCK_INTERVAL, FSYNC_POLICY, logger
+        )
+    elif STORAGE == "segments":
+        writer = SegmentWriter(
+            SEGMENT_DIR,
+            [SCHEMA_TAG, encrypt_data(encode_schema(ITEM_IDS))],
+            FLUSH_ROWS,
+            FLUSH_INTERVAL,
+            FSYNC_POLICY,
+            logger,
+            span=SEGMENT_SPAN,
+        )
+        if writer.active_path():
+            ensure_schema(writer.active_path(), ITEM_IDS)
+    else:
+        ensure_schema(FILE_NAME, ITEM_IDS)
+        writer = PriceWriter(FILE_NAME, FLUSH_ROWS, FLUSH_INTERVAL, FSYNC_POLICY, logger)
+
+    rle = None
+    if CHANGE_ONLY and STORAGE == "csv":
+        rle = RunLengthEncoder(TICK_INTERVAL, HEARTBEAT_INTERVAL)
+    elif CHANGE_ONLY and STORAGE == "segments":
+        rle = RunLengthEncoder(
+            TICK_INTERVAL, HEARTBEAT_INTERVAL, lambda t: partition_key(t, SEGMENT_SPAN)
+        )
+
+    # SIGTERM cancels the loop like Ctrl+C so buffered rows get flushed
     try:
-        while True:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel
+        )
+    except NotImplementedError:
+        pass
+
+    rollup = None
+    if ROLLUPS_ENABLED:
+        rollup = Rollup(FILE_NAME, ITEM_IDS, encrypt_data, FSYNC_POLICY, logger)
+        rollup.replay(read_rows(since=rollup.replay_since()))
+
+    pool = None
+    if WORKERS > 0:
+        pool = WorkerPool(
+            WORKERS,
+            sources,
+            {
+                "items": ITEM_IDS,
+                "headers": HEADERS,
+                "timeouts": [CONNECT_TIMEOUT, READ_TIMEOUT],
+                "extractor": EXTRACTOR,
+                "retries": 3,
+                "retry_delay": RETRY_DELAY,
+                "retry_max_delay": RETRY_MAX_DELAY,
+            },
+            logger,
+        )
+        await pool.start()
+
+    api = None
+    metrics_server = None
+    try:
+        # A port in use leaves the collector running without that endpoint
+        if API_ENABLED:
             try:
-                now = datetime.datetime.now(iran_tz).strftime("%Y-%m-%d %H:%M:%S")
-
-                tether = get_tether_price()
-                usd = get_usd_price()
-                gold = get_gold_price()
-                coin = get_coin_price()
+                api = start_api(API_HOST, API_PORT, read_rows, store_path, INSTRUMENTS, logger)
+            except OSError as e:
+                logger.error(f"Read API not started on {API_HOST}:{API_PORT}: {e}")
+        if METRICS_ENABLED:
+            try:
+                metrics_server = start_metrics_server(METRICS_HOST, METRICS_PORT, logger=logger)
+            except OSError as e:
+                logger.error(f"Metrics not started on {METRICS_HOST}:{METRICS_PORT}: {e}")
 
-                raw_data = f"{tether},{usd},{gold},{coin}"
-                encrypted = encrypt_data(raw_data)
+        while True:
+            tick_time = await scheduler.wait()
+            tick_start = time.perf_counter()
 
-                write_to_csv(FILE_NAME, [now, encrypted])
-                logger.info(f"Logged: {raw_data}")
+            try:
+                now = datetime.datetime.fromtimestamp(tick_time, iran_tz).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+
+                # Leave a little of the period for encrypt and write
+                deadline = min(TICK_DEADLINE, scheduler.time_left() * 0.9) / TIME_SCALE
+                if pool:
+                    prices, missing = await collect_tick_workers(
+                        pool, sources, scheduler.ticks, deadline
+                    )
+                else:
+                    prices, missing = await collect_tick(sources, ITEM_IDS, deadline)
+                if not prices:
+                    raise RuntimeError("No source returned prices")
+
+                raw_data = format_row(prices, ITEM_IDS)
+                for item_id in ITEM_IDS:
+                    if prices.get(item_id) is None:
+                        INSTRUMENT_MISSING.inc(instrument=item_id)
+
+                with WRITE_ROW_SECONDS.time():
+                    if STORAGE == "binary":
+                        writer.write_row([now, [prices.get(i) for i in ITEM_IDS]])
+                    elif STORAGE == "block":
+                        writer.write_row([now, raw_data])
+                    elif rle:
+                        for row in rle.encode(now, raw_data, encrypt_data):
+                            writer.write_row(row)
+                    else:
+                        writer.write_row([now, encrypt_data(raw_data)])
+                if rollup:
+                    rollup.update(now, prices)
+                TICK_SECONDS.observe(time.perf_counter() - tick_start)
+
+                if missing:
+                    logger.warning(f"Logged: {raw_data} (missing sources: {', '.join(missing)})")
+                else:
+                    logger.info(f"Logged: {raw_data}")
 
             except Exception as e:
                 logger.error(f"Loop error: {e}", exc_info=True)
+                TICK_ERRORS.inc()
+                if rle:
+                    for row in rle.gap():
+                        writer.write_row(row)
+
+            if writer.flush_due():
+                writer.flush()
+
+    finally:
+        if rle:
+            for row in rle.close_run():
+                writer.write_row(row)
+        writer.close()
+        logger.info(f"Writer closed, {writer.rows_written} rows written")
+        if rollup:
+            rollup.close()
+        if api:
+            api.shutdown()
+        if metrics_server:
+            metrics_server.shutdown()
+        if pool:
+            await pool.close()
+
+
+if __name__ == "__main__":
+    logger.info("TGJU price logger started")
+
+    try:
+        asyncio.run(run_collector())
 
-            time.sleep(60)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.warning("Program stopped")
 
-    except KeyboardInterrupt:
-        logger.warning("Program stopped by user")
+    finally:
+        close_session()
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ===================== SHARDED FETCH WORKERS =====================
+
+# With WORKERS > 0, server.py starts that many copies of this file as child
+# processes and deals the sources out between them round-robin. Each worker
+# downloads and parses its shard every tick and sends the prices back as one
+# JSON line; only the parent process encrypts and appends to Prices.csv, so
+# rows stay ordered and appends never interleave.
+#
+# Protocol, one JSON object per line:
+#   parent -> worker   first line: config; then {"tick": n, "deadline": s}
+#   worker -> parent   {"tick": n, "prices": {source: {id: price}},
+#                       "errors": {source: text}, "fetch": {source: s},
+#                       "parse": {source: s}, "status": {source: [codes]},
+#                       "retries": {source: n}}
+#
+# Workers import only requests and extractor, never server.py, so starting
+# one has no side effects on config.json, the key check or the log file.
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+# ===================== WORKER SIDE =====================
+
+
+class ShardFetcher:
+    def __init__(self, config):
+        self.config = config
+        self.items = config["items"]
+        self.sessions = {}
+        self.page_cache = {}
+
+        for source in config["sources"]:
+            self.sessions[source["url"]] = self.new_session()
+
+    def new_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.headers.update(self.config["headers"])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def reset_session(self, url):
+        # Like server.fetch_page: a failed request may leave a dead
+        # keep-alive connection in the pool, so the next attempt starts clean
+        self.sessions[url].close()
+        self.sessions[url] = self.new_session()
+
+    def fetch_page(self, url, statuses, timeout):
+        # Same conditional GET as server.fetch_page, with a cache per worker
+        headers = {}
+        cached = self.page_cache.get(url)
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.sessions[url].get(url, headers=headers, timeout=timeout)
+        statuses.append(response.status_code)
+
+        if response.status_code == 304 and cached:
+            return cached["text"]
+
+        response.raise_for_status()
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.page_cache[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "text": response.text,
+            }
+        else:
+            self.page_cache.pop(url, None)
+
+        return response.text
+
+    def fetch_source(self, source, until):
+        from requests import RequestException
+
+        from extractor import extract_prices
+        from scheduler import backoff_delay
+
+        config = self.config
+        items = source.get("items") or self.items
+        report = {"status": [], "retries": 0, "fetch": 0.0, "parse": 0.0}
+
+        for attempt in range(1, config["retries"] + 1):
+            try:
+                # Socket timeouts within the deadline, as in server.fetch_source
+                left = max(0.1, until - time.monotonic())
+                timeout = tuple(min(t, left) for t in config["timeouts"])
+
+                start = time.perf_counter()
+                html = self.fetch_page(source["url"], report["status"], timeout)
+                report["fetch"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                prices = extract_prices(
+                    html, items, config["extractor"], None, False, source.get("expected")
+                )
+                report["parse"] += time.perf_counter() - start
+
+                if not prices:
+                    raise RuntimeError("No items found in HTML")
+                # As server.learn_expected
+                if "expected" not in source:
+                    source["expected"] = source.get("items") or sorted(prices)
+                report["prices"] = prices
+                return report
+
+            except Exception as e:
+                report["error"] = f"{type(e).__name__}: {e}"
+                report["retries"] += 1
+                if isinstance(e, RequestException):
+                    self.reset_session(source["url"])
+
+            if attempt < config["retries"]:
+                delay = backoff_delay(
+                    attempt, config["retry_delay"], config["retry_max_delay"]
+                )
+                if time.monotonic() + delay >= until:
+                    break
+                time.sleep(delay)
+
+        return report
+
+    def run_tick(self, pool, tick, deadline):
+        until = time.monotonic() + deadline
+        futures = {
+            source["name"]: pool.submit(self.fetch_source, source, until)
+            for source in self.config["sources"]
+        }
+
+        reply = {
+            "tick": tick, "prices": {}, "errors": {},
+            "fetch": {}, "parse": {}, "status": {}, "retries": {},
+        }
+        for name, future in futures.items():
+            report = future.result()
+            if "prices" in report:
+                reply["prices"][name] = report["prices"]
+            else:
+                reply["errors"][name] = report.get("error", "failed")
+            reply["fetch"][name] = report["fetch"]
+            reply["parse"][name] = report["parse"]
+            reply["status"][name] = report["status"]
+            reply["retries"][name] = report["retries"]
+        return reply
+
+
+def serve():
+    config = json.loads(sys.stdin.readline())
+    fetcher = ShardFetcher(config)
+    pool = ThreadPoolExecutor(max(1, len(config["sources"])))
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        reply = fetcher.run_tick(pool, request["tick"], request["deadline"])
+        sys.stdout.write(json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+
+# ===================== PARENT SIDE =====================
+
+
+class WorkerPool:
+    # Owns the worker processes; collect() fans one tick out to every shard
+    # and returns the replies that arrive before the deadline.
+
+    def __init__(self, count, sources, config, logger=None):
+        self.count = max(1, min(count, len(sources)))
+        self.shards = [sources[n::self.count] for n in range(self.count)]
+        self.config = config
+        self.logger = logger
+        self.procs = [None] * self.count
+
+    async def start_worker(self, n):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        config = dict(self.config, sources=self.shards[n])
+        proc.stdin.write((json.dumps(config) + "\n").encode())
+        await proc.stdin.drain()
+        self.procs[n] = proc
+
+        if self.logger:
+            names = ", ".join(source["name"] for source in self.shards[n])
+            self.logger.info(f"Worker {n} (pid {proc.pid}) fetching {names}")
+
+    async def start(self):
+        for n in range(self.count):
+            await self.start_worker(n)
+
+    async def ask(self, n, tick, deadline):
+        proc = self.procs[n]
+        if proc is None or proc.returncode is not None:
+            if self.logger:
+                self.logger.warning(f"Worker {n} is not running, restarting")
+            await self.start_worker(n)
+            proc = self.procs[n]
+
+        proc.stdin.write((json.dumps({"tick": tick, "deadline": deadline}) + "\n").encode())
+        await proc.stdin.drain()
+
+        # Replies to ticks that already timed out are stale; skip them
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                raise RuntimeError(f"Worker {n} exited")
+            reply = json.loads(line)
+            if reply["tick"] == tick:
+                return reply
+
+    async def collect(self, tick, deadline):
+        tasks = {
+            asyncio.create_task(self.ask(n, tick, deadline)): n for n in range(self.count)
+        }
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        replies, missing = [], []
+        for task in pending:
+            task.cancel()
+            missing += [source["name"] for source in self.shards[tasks[task]]]
+            if self.logger:
+                self.logger.warning(f"Worker {tasks[task]} missed the {deadline:.1f}s tick deadline")
+
+        for task in done:
+            if task.exception():
+                missing += [source["name"] for source in self.shards[tasks[task]]]
+                if self.logger:
+                    self.logger.warning(f"Worker {tasks[task]} failed: {task.exception()}")
+            else:
+                replies.append(task.result())
+
+        return replies, missing
+
+    async def close(self):
+        for proc in self.procs:
+            if proc is None or proc.returncode is not None:
+                continue
+            proc.stdin.close()
+            try:
+                await asyncio.wait_for(proc.wait(), 5)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+
+
+if __name__ == "__main__":
+    try:
+        serve()
+    except KeyboardInterrupt:
+        pass
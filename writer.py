@@ -0,0 +1,181 @@
+import csv
+import os
+import time
+
+from instruments import RUN_TAG, time_to_int
+from metrics import counter, histogram
+
+# ===================== BUFFERED WRITER =====================
+
+# "none": leave it to the OS, "batch": fsync after each flush,
+# "row": flush and fsync every row
+FSYNC_POLICIES = ("none", "batch", "row")
+
+FLUSH_SECONDS = histogram("gcpms_flush_seconds", "Batch write and fsync time per file")
+ROWS_WRITTEN = counter("gcpms_rows_written_total", "Rows appended per file")
+
+
+class PriceWriter:
+    # Keeps Prices.csv open and appends rows in batches. A batch is written
+    # once flush_rows rows are buffered or flush_interval seconds have passed
+    # since the last flush, whichever comes first.
+
+    def __init__(
+        self, file_path, flush_rows=10, flush_interval=60.0, fsync="batch", logger=None
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+
+        self.file_path = file_path
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.logger = logger
+
+        self.file = None
+        self.csv = None
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        if self.file is None:
+            self.file = open(self.file_path, "a", newline="", encoding="utf-8")
+            self.csv = csv.writer(self.file)
+        return self
+
+    def flush_due(self):
+        return (
+            bool(self.buffer)
+            and time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def write_row(self, row):
+        self.buffer.append(row)
+
+        if (
+            self.fsync == "row"
+            or len(self.buffer) >= self.flush_rows
+            or self.flush_due()
+        ):
+            self.flush()
+
+    def write_rows(self, rows):
+        self.csv.writerows(rows)
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+
+        start = time.perf_counter()
+        try:
+            self.open()
+            self.write_rows(self.buffer)
+            self.file.flush()
+            if self.fsync != "none":
+                os.fsync(self.file.fileno())
+
+        except OSError as e:
+            # Rows stay buffered and are retried on the next flush
+            if self.logger:
+                self.logger.error(f"CSV write error: {e}", exc_info=True)
+            self.close_file()
+            return
+
+        name = os.path.basename(self.file_path)
+        FLUSH_SECONDS.observe(time.perf_counter() - start, file=name)
+
+        count = len(self.buffer)
+        self.rows_written += count
+        ROWS_WRITTEN.inc(count, file=name)
+        self.buffer.clear()
+
+        if self.logger:
+            self.logger.debug(f"Flushed {count} rows to {self.file_path}")
+
+    def close_file(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+            self.csv = None
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.close_file()
+
+
+# ===================== CHANGE-ONLY =====================
+
+
+class RunLengthEncoder:
+    # Turns ticks into the rows worth writing. A tick whose prices equal the
+    # previous one, one interval later, only extends a run. The run is
+    # written as a "<time>,=<n>" line when prices change, when a tick is
+    # missed, and at least every heartbeat seconds, so a missing stretch
+    # always means the collector had no data rather than flat prices.
+
+    def __init__(self, interval, heartbeat, split=None):
+        # split(time_text) -> partition key; runs never cross partitions,
+        # so a segment never begins with a run line
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.split = split
+        self.last_key = None
+
+        self.last_raw = None
+        self.last_tick = None
+        self.anchor = None
+        self.run = 0
+        self.run_end = None
+
+    def encode(self, time_text, raw_data, encrypt):
+        t = time_to_int(time_text)
+        contiguous = (
+            self.last_tick is not None and abs(t - self.last_tick - self.interval) < 1
+        )
+        if self.split:
+            key = self.split(time_text)
+            contiguous = contiguous and key == self.last_key
+            self.last_key = key
+        rows = []
+
+        if raw_data == self.last_raw and contiguous:
+            self.run += 1
+            self.run_end = time_text
+            if t - self.anchor >= self.heartbeat:
+                rows += self.close_run()
+        else:
+            rows += self.close_run()
+            rows.append([time_text, encrypt(raw_data)])
+            self.last_raw = raw_data
+            self.anchor = t
+
+        self.last_tick = t
+        return rows
+
+    def close_run(self):
+        if not self.run:
+            return []
+
+        row = [self.run_end, f"{RUN_TAG}{self.run}"]
+        self.anchor = time_to_int(self.run_end)
+        self.run = 0
+        return [row]
+
+    def gap(self):
+        # A failed or skipped tick ends the run; the next tick is a full row
+        rows = self.close_run()
+        self.last_tick = None
+        return rows